@@ -18,6 +18,7 @@ class Settings(BaseSettings):
     retry_attempts: int = 3
     retry_backoff: float = 1.0
     debug: bool = False
+    extract_workers: int | None = None  # Worker processes for text extraction; default is CPU count - 1
 
     # v1.5 Advanced RAG settings
     retrieval_strategy: str = "vector"  # "vector", "bm25", "hybrid", "hybrid_rerank"
@@ -25,6 +26,7 @@ class Settings(BaseSettings):
     use_recursive_retrieval: bool = False
     enable_reranking: bool = False
     confidence_threshold: float = 0.5  # For recursive retrieval
+    reranker_onnx_path: Path | None = None  # Int8 ONNX cross-encoder for CPU re-ranking
 
     model_config = {"env_file": ".env", "env_prefix": "LAW_"}
 
@@ -1,8 +1,44 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 import aiosqlite
 from config import settings
 
 DB_PATH = str(settings.db_path())
 
+# SQLite in WAL mode allows many concurrent readers but only one writer, so the
+# pool keeps a single writer connection behind a lock plus a few readers.
+READER_POOL_SIZE = min(os.cpu_count() or 1, 4)
+
+# Prepared statements kept per connection (sqlite3 caches by SQL text). Pooled
+# connections live for the whole process, so the cache stays warm.
+STATEMENT_CACHE_SIZE = 256
+
+_writer: aiosqlite.Connection | None = None
+_write_lock = asyncio.Lock()
+_readers: asyncio.Queue[aiosqlite.Connection] | None = None
+_pool_lock = asyncio.Lock()
+
+# Applied once per connection. synchronous=NORMAL is durable under WAL except
+# for the last commits on power loss, and busy_timeout makes writers wait for
+# the lock instead of failing with SQLITE_BUSY.
+CONNECTION_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA busy_timeout=5000;
+PRAGMA cache_size=-64000;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA wal_autocheckpoint=1000;
+PRAGMA foreign_keys=ON;
+"""
+
+# Current UTC time in the same ISO-8601 shape as datetime.isoformat() (to the
+# millisecond), so SQL-stamped rows sort and parse like Python-stamped ones.
+SQL_NOW = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"
+
 MIGRATIONS = [
     """
     CREATE TABLE IF NOT EXISTS workspaces (
@@ -79,16 +115,12 @@ MIGRATIONS = [
     );
     """,
     """
-    CREATE INDEX IF NOT EXISTS idx_conversations_workspace
-    ON conversations(workspace_id);
-    """,
-    """
-    CREATE INDEX IF NOT EXISTS idx_messages_conversation
-    ON messages(conversation_id);
+    CREATE INDEX IF NOT EXISTS idx_messages_conv_created
+    ON messages(conversation_id, created_at);
     """,
     """
-    CREATE INDEX IF NOT EXISTS idx_documents_workspace
-    ON documents(workspace_id);
+    CREATE INDEX IF NOT EXISTS idx_documents_ws_created
+    ON documents(workspace_id, created_at DESC);
     """,
     """
     CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_hash
@@ -99,10 +131,54 @@ MIGRATIONS = [
     ON conversations(is_pinned);
     """,
     """
-    CREATE INDEX IF NOT EXISTS idx_prompt_templates_category
-    ON prompt_templates(category);
+    CREATE INDEX IF NOT EXISTS idx_templates_cat_builtin_name
+    ON prompt_templates(category, is_builtin DESC, name);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_templates_builtin_name
+    ON prompt_templates(is_builtin DESC, name);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_workspaces_updated
+    ON workspaces(updated_at DESC);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_conversations_ws_pinned_updated
+    ON conversations(workspace_id, is_pinned DESC, updated_at DESC);
+    """,
+]
+
+# Full-text index over message content for /api/chat/search. It is an external
+# content table keyed on messages.rowid and kept in sync by triggers; anything
+# that renumbers messages rowids (e.g. VACUUM) must be followed by
+# INSERT INTO messages_fts(messages_fts) VALUES('rebuild').
+MESSAGES_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content,
+        content='messages',
+        content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.rowid, new.content);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.rowid, new.content);
+    END;
     """,
 ]
+MIGRATIONS += MESSAGES_FTS
 
 V1_MIGRATIONS = [
     "ALTER TABLE conversations ADD COLUMN is_pinned INTEGER NOT NULL DEFAULT 0;",
@@ -131,27 +207,212 @@ V1_MIGRATIONS = [
     "CREATE INDEX IF NOT EXISTS idx_prompt_templates_category ON prompt_templates(category);",
 ]
 
+V2_MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS idx_messages_conv_created ON messages(conversation_id, created_at);",
+    "CREATE INDEX IF NOT EXISTS idx_conversations_ws_pinned_updated ON conversations(workspace_id, is_pinned DESC, updated_at DESC);",
+    # Superseded by idx_messages_conv_created, which covers the same prefix.
+    "DROP INDEX IF EXISTS idx_messages_conversation;",
+]
 
-async def get_db() -> aiosqlite.Connection:
-    db = await aiosqlite.connect(DB_PATH)
+# MIGRATIONS always describes the current schema and is applied as a whole to
+# a fresh database; UPGRADES[n - 1] moves an existing database from version n
+# to n + 1.
+V3_MIGRATIONS = MESSAGES_FTS + [
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild');",
+]
+
+V4_MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS idx_documents_ws_created ON documents(workspace_id, created_at DESC);",
+    # Both are left-prefixes of a composite index and only cost writes.
+    "DROP INDEX IF EXISTS idx_documents_workspace;",
+    "DROP INDEX IF EXISTS idx_conversations_workspace;",
+]
+
+# Let the template and workspace listings read rows in index order instead of
+# sorting them.
+V5_MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS idx_templates_cat_builtin_name ON prompt_templates(category, is_builtin DESC, name);",
+    "CREATE INDEX IF NOT EXISTS idx_templates_builtin_name ON prompt_templates(is_builtin DESC, name);",
+    "CREATE INDEX IF NOT EXISTS idx_workspaces_updated ON workspaces(updated_at DESC);",
+    # A left-prefix of idx_templates_cat_builtin_name.
+    "DROP INDEX IF EXISTS idx_prompt_templates_category;",
+]
+
+UPGRADES = [V1_MIGRATIONS, V2_MIGRATIONS, V3_MIGRATIONS, V4_MIGRATIONS, V5_MIGRATIONS]
+SCHEMA_VERSION = len(UPGRADES) + 1
+
+# One of "idle", "migrating", "ready" or "failed"; reported by /api/health.
+_migration_state = "idle"
+_migration_task: asyncio.Task | None = None
+
+
+async def _configure(db: aiosqlite.Connection) -> aiosqlite.Connection:
     db.row_factory = aiosqlite.Row
-    await db.execute("PRAGMA journal_mode=WAL")
-    await db.execute("PRAGMA foreign_keys=ON")
+    await db.executescript(CONNECTION_PRAGMAS)
     return db
 
 
+async def _connect() -> aiosqlite.Connection:
+    return await _configure(await aiosqlite.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE))
+
+
+async def _connect_pooled() -> aiosqlite.Connection:
+    conn = aiosqlite.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE)
+    # Pooled connections live for the whole process; don't let their worker
+    # threads keep the interpreter alive if the pool is never closed.
+    conn.daemon = True
+    return await _configure(await conn)
+
+
+async def open_pool():
+    """Open the long-lived writer and reader connections (idempotent)."""
+    global _writer, _readers
+    async with _pool_lock:
+        if _writer is not None:
+            return
+        writer = await _connect_pooled()
+        readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        for _ in range(READER_POOL_SIZE):
+            reader = await _connect_pooled()
+            await reader.execute("PRAGMA query_only=ON")
+            readers.put_nowait(reader)
+        _writer, _readers = writer, readers
+
+
+async def close_pool():
+    """Close every pooled connection."""
+    global _writer, _readers
+    async with _pool_lock:
+        if _writer is None:
+            return
+        await _writer.execute("PRAGMA optimize")
+        await _writer.close()
+        while not _readers.empty():
+            await _readers.get_nowait().close()
+        _writer, _readers = None, None
+
+
+@asynccontextmanager
+async def get_read_db() -> AsyncIterator[aiosqlite.Connection]:
+    """Borrow a read-only connection from the pool."""
+    await _wait_for_migrations()
+    if _readers is None:
+        await open_pool()
+    readers = _readers
+    db = await readers.get()
+    try:
+        yield db
+    finally:
+        readers.put_nowait(db)
+
+
+@asynccontextmanager
+async def get_write_db() -> AsyncIterator[aiosqlite.Connection]:
+    """
+    Hold the single writer connection for the duration of the block.
+
+    Anything left uncommitted when the block exits is rolled back, matching
+    the old behaviour of closing a per-request connection.
+    """
+    await _wait_for_migrations()
+    if _writer is None:
+        await open_pool()
+    async with _write_lock:
+        db = _writer
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                await db.rollback()
+
+
+async def _wait_for_migrations():
+    if _migration_task is not None and not _migration_task.done():
+        await asyncio.shield(_migration_task)
+
+
+async def _schema_version(db: aiosqlite.Connection) -> int:
+    """Return the stored schema version, 0 for an empty database."""
+    await db.execute("CREATE TABLE IF NOT EXISTS schema_version (v INTEGER PRIMARY KEY)")
+    async with db.execute("SELECT MAX(v) FROM schema_version") as cursor:
+        (version,) = await cursor.fetchone()
+    if version is not None:
+        return version
+
+    # Databases created before schema_version existed: infer from the columns
+    # the first upgrade added.
+    async with db.execute("SELECT name FROM pragma_table_info('conversations')") as cursor:
+        columns = {row[0] for row in await cursor.fetchall()}
+    if not columns:
+        return 0
+    return 2 if "is_pinned" in columns else 1
+
+
 async def init_db():
-    db = await get_db()
+    db = await _connect()
     try:
-        for migration in MIGRATIONS:
-            await db.execute(migration)
+        version = await _schema_version(db)
+        if version >= SCHEMA_VERSION:
+            return
+
+        if version == 0:
+            statements = MIGRATIONS
+        else:
+            statements = [stmt for step in UPGRADES[version - 1:] for stmt in step]
+        script = "\n".join(stmt.strip() for stmt in statements)
+        await db.executescript(
+            f"BEGIN IMMEDIATE;\n{script}\n"
+            f"INSERT INTO schema_version (v) VALUES ({SCHEMA_VERSION});\n"
+            "COMMIT;"
+        )
+
+        # Refresh planner statistics so new indexes get picked.
+        await db.execute("ANALYZE;")
         await db.commit()
+    finally:
+        await db.close()
+
 
-        for migration in V1_MIGRATIONS:
-            try:
-                await db.execute(migration)
-                await db.commit()
-            except Exception:
-                pass
+async def fail_interrupted_ingests():
+    """
+    Mark documents left 'processing' by a previous run as failed.
+
+    Ingestion runs in-process, so nothing is still working on them after a
+    restart; left alone they could never be deleted or re-ingested.
+    """
+    db = await _connect()
+    try:
+        await db.execute(
+            "UPDATE documents SET status = 'error', error_message = 'Ingestion was interrupted' "
+            "WHERE status = 'processing'"
+        )
+        await db.commit()
     finally:
         await db.close()
+
+
+async def _migrate_and_open():
+    global _migration_state
+    _migration_state = "migrating"
+    try:
+        await init_db()
+        await fail_interrupted_ingests()
+        await open_pool()
+    except Exception:
+        _migration_state = "failed"
+        raise
+    _migration_state = "ready"
+
+
+def start_migrations() -> asyncio.Task:
+    """
+    Run init_db and open the pool in the background so the server can accept
+    requests straight away; database access waits for it to finish.
+    """
+    global _migration_task
+    _migration_task = asyncio.create_task(_migrate_and_open())
+    return _migration_task
+
+
+def migration_status() -> str:
+    return _migration_state
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import logging.handlers
 import time
@@ -5,12 +6,13 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
 from config import settings
-from database import init_db, get_db
+from database import start_migrations, migration_status, close_pool, get_read_db
 from routers import chat, documents, workspaces, ollama, app_settings, templates
-from services.ollama_service import OllamaService
+from services.ollama_service import OllamaService, close_client
+from utils.process_pool import shutdown_process_pool
 
 
 def setup_logging():
@@ -42,21 +44,45 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
+def _log_migration_result(task: asyncio.Task):
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error("Database initialization failed", exc_info=task.exception())
+    else:
+        logger.info("Database initialized")
+
+
+def _log_seed_result(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Seeding built-in templates failed", exc_info=task.exception())
+
+
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     logger.info("Starting Local AI Workspace backend v1.0.0")
     logger.info("Data directory: %s", settings.data_dir)
     settings.data_dir.mkdir(parents=True, exist_ok=True)
-    await init_db()
-    logger.info("Database initialized")
+    migrations = start_migrations()
+    migrations.add_done_callback(_log_migration_result)
+    # Waits on the migrations itself, so startup isn't held up.
+    seed = asyncio.create_task(templates.seed_builtins())
+    seed.add_done_callback(_log_seed_result)
     yield
     logger.info("Shutting down")
+    pending = [task for task in (migrations, seed) if not task.done()]
+    if pending:
+        await asyncio.wait(pending)
+    await close_client()
+    await close_pool()
+    await asyncio.to_thread(shutdown_process_pool)
 
 
 app = FastAPI(
     title="Local AI Workspace API",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -98,33 +124,47 @@ app.include_router(app_settings.router, prefix="/api/settings", tags=["settings"
 app.include_router(templates.router, prefix="/api/templates", tags=["templates"])
 
 
+# Frontends and supervisors poll /api/health often; probe Ollama and the
+# database at most once per TTL and serve the cached answer in between.
+HEALTH_CACHE_TTL = 2.0
+_health_cache: dict = {"ts": 0.0, "data": None}
+_health_ollama = OllamaService()
+
+
 @app.get("/api/health")
 async def health():
+    now = time.monotonic()
+    if _health_cache["data"] is not None and now - _health_cache["ts"] < HEALTH_CACHE_TTL:
+        return _health_cache["data"]
+
     ollama_ok = False
     ollama_error = None
     try:
-        svc = OllamaService()
-        ollama_ok = await svc.is_running()
+        ollama_ok = await _health_ollama.is_running()
     except Exception as e:
         ollama_error = str(e)
 
     db_ok = False
-    try:
-        db = await get_db()
-        await db.execute("SELECT 1")
-        await db.close()
-        db_ok = True
-    except Exception:
-        pass
+    db_status = migration_status()
+    if db_status not in ("migrating", "failed"):
+        try:
+            async with get_read_db() as db:
+                await db.execute("SELECT 1")
+            db_ok = True
+        except Exception:
+            pass
 
     overall = "ok" if (ollama_ok and db_ok) else "degraded"
 
-    return {
+    data = {
         "status": overall,
         "version": "1.0.0",
         "services": {
             "ollama": {"ok": ollama_ok, "error": ollama_error},
-            "database": {"ok": db_ok},
+            "database": {"ok": db_ok, "status": db_status},
         },
         "privacy": "All data stays on your device.",
     }
+    _health_cache["ts"] = time.monotonic()
+    _health_cache["data"] = data
+    return data
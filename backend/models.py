@@ -161,6 +161,5 @@ class ConversationSearchResult(BaseModel):
     conversation_title: str
     message_id: str
     role: str
-    content: str
     match_preview: str
     created_at: str
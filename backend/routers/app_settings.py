@@ -1,23 +1,19 @@
+import asyncio
 import json
 
 from fastapi import APIRouter
-from database import get_db
+from database import get_read_db, get_write_db
 from models import SettingsUpdate
 from config import settings
 
 router = APIRouter()
 
+# Decoded settings, filled on first read and replaced on every write.
+_settings_cache: dict | None = None
+_cache_lock = asyncio.Lock()
 
-@router.get("/")
-async def get_settings():
-    db = await get_db()
-    try:
-        cursor = await db.execute("SELECT key, value FROM app_settings")
-        rows = await cursor.fetchall()
-        stored = {row["key"]: row["value"] for row in rows}
-    finally:
-        await db.close()
 
+def _decode_settings(stored: dict[str, str]) -> dict:
     return {
         "chat_model": stored.get("chat_model", settings.default_chat_model),
         "embedding_model": stored.get("embedding_model", settings.default_embedding_model),
@@ -31,18 +27,34 @@ async def get_settings():
     }
 
 
+@router.get("/")
+async def get_settings():
+    global _settings_cache
+    if _settings_cache is None:
+        async with _cache_lock:
+            if _settings_cache is None:
+                async with get_read_db() as db:
+                    cursor = await db.execute("SELECT key, value FROM app_settings")
+                    rows = await cursor.fetchall()
+                stored = {row["key"]: row["value"] for row in rows}
+                _settings_cache = _decode_settings(stored)
+    return dict(_settings_cache)
+
+
 @router.put("/")
 async def update_settings(body: SettingsUpdate):
-    db = await get_db()
-    try:
-        updates = body.model_dump(exclude_none=True)
-        for key, value in updates.items():
-            await db.execute(
-                "INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)",
-                (key, str(value)),
-            )
+    global _settings_cache
+    updates = {key: str(value) for key, value in body.model_dump(exclude_none=True).items()}
+    async with get_write_db() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("SELECT key, value FROM app_settings")
+        stored = {row["key"]: row["value"] for row in await cursor.fetchall()}
+        await db.executemany(
+            "INSERT OR REPLACE INTO app_settings (key, value) VALUES (?, ?)",
+            list(updates.items()),
+        )
         await db.commit()
-    finally:
-        await db.close()
+        async with _cache_lock:
+            _settings_cache = _decode_settings(stored | updates)
 
-    return await get_settings()
+    return dict(_settings_cache)
@@ -1,11 +1,15 @@
-import json
-import uuid
-from datetime import datetime, timezone
+import asyncio
+import functools
+import orjson
+from collections import Counter
+from typing import AsyncIterator
 
+import aiosqlite
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse, Response
+from pydantic import TypeAdapter
 
-from database import get_db
+from database import SQL_NOW, get_read_db, get_write_db
 from models import (
     ChatRequest, ConversationCreate, ConversationUpdate,
     Conversation, Message, EditMessageRequest, ConversationSearchResult,
@@ -13,163 +17,342 @@ from models import (
 from services.ollama_service import OllamaService
 from services.rag_service import RAGService
 from config import settings
+from utils.ids import uuid7
 
 router = APIRouter()
 ollama = OllamaService()
 rag = RAGService()
 
+# Built once so the list endpoints can validate and serialise rows directly
+# instead of going through FastAPI's response_model handling per request.
+_CONV_LIST = TypeAdapter(list[Conversation])
+_MSG = TypeAdapter(Message)
 
-async def _enrich_conversation(row: dict) -> dict:
-    row["is_pinned"] = bool(row.get("is_pinned", 0))
-    db = await get_db()
-    try:
+# Columns backing the Conversation and Message models, selected explicitly so
+# the hot queries don't copy anything the response doesn't use.
+_CONV_COLUMNS = "id, workspace_id, title, mode, system_prompt, is_pinned, folder, created_at, updated_at"
+_MSG_COLUMNS = "id, conversation_id, role, content, sources, created_at"
+
+# Rows fetched and encoded per chunk by the streaming endpoints.
+_STREAM_BATCH = 200
+
+# Ids per IN (...) query, well under SQLite's bound-parameter limit.
+_IN_BATCH = 500
+
+# Streamed tokens are buffered until this many characters are pending or this
+# many seconds have passed since the last frame went out.
+SSE_FLUSH_CHARS = 4096
+SSE_FLUSH_INTERVAL = 0.005
+
+
+_SSE_DATA = b"data: "
+_SSE_END = b"\n\n"
+
+# Every chunk frame shares the same envelope, so only the content string needs
+# encoding per frame.
+_CHUNK_PREFIX = _SSE_DATA + b'{"type":"chunk","content":'
+_CHUNK_SUFFIX = b"}" + _SSE_END
+
+
+def _chunk_frame(content: str) -> bytes:
+    return _CHUNK_PREFIX + orjson.dumps(content) + _CHUNK_SUFFIX
+
+
+def _event_frame(event: dict) -> bytes:
+    # done/error frames are sent once per turn, so a full encode is fine here.
+    return _SSE_DATA + orjson.dumps(event) + _SSE_END
+
+
+# Static parts of the workspace-mode system prompt around the retrieved excerpts.
+_RAG_PREFIX = (
+    "Answer the user's question based on the following document excerpts. "
+    "Use inline citations like [1], [2], etc. to reference specific sources. "
+    "If the documents don't contain relevant information, say so clearly.\n\n"
+    "--- DOCUMENTS ---\n"
+)
+_RAG_SUFFIX = "\n--- END DOCUMENTS ---"
+
+
+def _context_entry(i: int, s: dict) -> str:
+    page_info = f" (page {s['page']})" if s.get("page") else ""
+    return (
+        f"[{i}] {s['filename']}{page_info} "
+        f"[confidence: {s.get('confidence', 'unknown')}, score: {s.get('score', 0):.3f}]:\n{s['chunk_text']}"
+    )
+
+
+def _confidence_breakdown(results: list[dict]) -> dict[str, int]:
+    """Count retrieval results per confidence level in a single pass."""
+    counts = Counter(r.get("confidence") for r in results)
+    return {"high": counts["high"], "medium": counts["medium"], "low": counts["low"]}
+
+
+def _fts_query(q: str) -> str:
+    # Quote every term so user input can't inject FTS5 operators, and match
+    # each one as a prefix so partially typed words still hit.
+    terms = [t.replace('"', '""') for t in q.split()]
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_sources(raw: str) -> tuple[dict, ...]:
+    # A tuple so the cached value can't be appended to by a caller.
+    return tuple(orjson.loads(raw))
+
+
+def _decode_sources(raw: str | None) -> list:
+    # Most messages (every user turn, most general-mode replies) store "[]".
+    if raw is None or raw == "[]" or raw == "":
+        return []
+    # Open conversations are read repeatedly (list, reopen, export), so each
+    # stored blob is parsed once and served from the cache after that.
+    return list(_parse_sources(raw))
+
+
+def _message_dict(row) -> dict:
+    return {
+        "id": row["id"],
+        "conversation_id": row["conversation_id"],
+        "role": row["role"],
+        "content": row["content"],
+        "sources": _decode_sources(row["sources"]),
+        "created_at": row["created_at"],
+    }
+
+
+async def _message_batches(columns: str, conversation_id: str) -> AsyncIterator[list]:
+    """
+    Yield a conversation's messages in order, _STREAM_BATCH rows at a time.
+
+    Each batch is read on its own pooled connection and seeks past the last
+    row of the one before on (created_at, rowid), so a slow client never
+    holds a reader, or pins a WAL snapshot, for the whole download.
+    """
+    sql = (
+        f"SELECT {columns}, created_at AS _seek_created, rowid AS _seek_rowid FROM messages "
+        "WHERE conversation_id = ? {seek} ORDER BY created_at ASC, rowid ASC LIMIT ?"
+    )
+    rows = None
+    while True:
+        async with get_read_db() as db:
+            if rows is None:
+                cursor = await db.execute(sql.format(seek=""), (conversation_id, _STREAM_BATCH))
+            else:
+                last = rows[-1]
+                cursor = await db.execute(
+                    sql.format(seek="AND (created_at, rowid) > (?, ?)"),
+                    (conversation_id, last["_seek_created"], last["_seek_rowid"], _STREAM_BATCH),
+                )
+            rows = await cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < _STREAM_BATCH:
+            return
+
+
+async def _stream_json_array(batches: AsyncIterator[list], encode) -> AsyncIterator[bytes]:
+    """
+    Stream row batches as one JSON array, so long results never have to be
+    materialised or encoded in one piece.
+    """
+    opened = False
+    async for rows in batches:
+        yield (b"," if opened else b"[") + encode(rows)
+        opened = True
+    yield b"]" if opened else b"[]"
+
+
+def _export_section(msg) -> list[str]:
+    role_label = "You" if msg["role"] == "user" else "Assistant"
+    lines = [f"### {role_label}", "", msg["content"]]
+    sources = _decode_sources(msg["sources"])
+    if sources:
+        lines.append("")
+        lines.append("**Sources:**")
+        for i, s in enumerate(sources, 1):
+            page_info = f" (p. {s.get('page', '')})" if s.get("page") else ""
+            lines.append(f"- [{i}] {s['filename']}{page_info}")
+    lines.extend(["", "---", ""])
+    return lines
+
+
+def _json_list(adapter: TypeAdapter, rows: list[dict]) -> Response:
+    return Response(
+        content=adapter.dump_json(adapter.validate_python(rows)),
+        media_type="application/json",
+    )
+
+
+async def _load_tags(db, conversation_ids: list[str]) -> dict[str, list[str]]:
+    """Fetch the tags of many conversations in as few queries as possible."""
+    tags_by_id: dict[str, list[str]] = {cid: [] for cid in conversation_ids}
+    for start in range(0, len(conversation_ids), _IN_BATCH):
+        batch = conversation_ids[start:start + _IN_BATCH]
         cursor = await db.execute(
-            "SELECT tag FROM conversation_tags WHERE conversation_id = ?",
-            (row["id"],),
+            f"SELECT conversation_id, tag FROM conversation_tags WHERE conversation_id IN ({','.join('?' * len(batch))})",
+            batch,
         )
-        tag_rows = await cursor.fetchall()
-        row["tags"] = [r["tag"] for r in tag_rows]
-    finally:
-        await db.close()
-    return row
+        for conversation_id, tag in await cursor.fetchall():
+            tags_by_id[conversation_id].append(tag)
+    return tags_by_id
+
+
+def _conversation_dict(row, tags_by_id: dict[str, list[str]]) -> dict:
+    return {
+        "id": row["id"],
+        "workspace_id": row["workspace_id"],
+        "title": row["title"],
+        "mode": row["mode"],
+        "system_prompt": row["system_prompt"],
+        "is_pinned": bool(row["is_pinned"]),
+        "folder": row["folder"],
+        "tags": tags_by_id.get(row["id"], []),
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+@functools.lru_cache(maxsize=64)
+def _conversation_update_sql(columns: tuple[str, ...]) -> str:
+    # One stable statement per column combination, so SQLite's statement
+    # cache keeps hitting instead of compiling fresh text every call.
+    assignments = ", ".join(f"{c} = ?" for c in columns)
+    return (
+        f"UPDATE conversations SET {assignments}, updated_at = {SQL_NOW} "
+        f"WHERE id = ? RETURNING {_CONV_COLUMNS}"
+    )
 
 
 @router.get("/conversations", response_model=list[Conversation])
-async def list_conversations(workspace_id: str | None = None):
-    db = await get_db()
-    try:
-        if workspace_id:
-            cursor = await db.execute(
-                "SELECT * FROM conversations WHERE workspace_id = ? ORDER BY is_pinned DESC, updated_at DESC",
-                (workspace_id,),
-            )
-        else:
-            cursor = await db.execute(
-                "SELECT * FROM conversations ORDER BY is_pinned DESC, updated_at DESC"
-            )
-        rows = await cursor.fetchall()
-    finally:
-        await db.close()
-    return [await _enrich_conversation(dict(row)) for row in rows]
+async def list_conversations(
+    workspace_id: str | None = None,
+    limit: int | None = Query(None, ge=1, le=500),
+    cursor: str | None = None,
+):
+    """
+    List conversations, pinned first, then most recently updated.
+
+    Without ``limit`` every conversation is returned. With it, at most
+    ``limit`` rows come back and, if more remain, the ``X-Next-Cursor``
+    response header carries the value to pass as ``cursor`` for the next page.
+    """
+    where, params = [], []
+    if workspace_id:
+        where.append("workspace_id = ?")
+        params.append(workspace_id)
+    if cursor:
+        try:
+            pinned, updated_at, rowid = cursor.split("|")
+            params += [int(pinned), int(pinned), updated_at, updated_at, int(rowid)]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Keyset seek matching the ORDER BY below, so later pages don't rescan.
+        where.append(
+            "(is_pinned < ? OR (is_pinned = ? AND (updated_at < ? OR (updated_at = ? AND rowid > ?))))"
+        )
+    sql = f"SELECT rowid, {_CONV_COLUMNS} FROM conversations"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY is_pinned DESC, updated_at DESC, rowid ASC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    async with get_read_db() as db:
+        rows = await (await db.execute(sql, params)).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = f"{last['is_pinned']}|{last['updated_at']}|{last['rowid']}"
+        tags_by_id = await _load_tags(db, [row["id"] for row in rows])
+
+    response = _json_list(_CONV_LIST, [_conversation_dict(row, tags_by_id) for row in rows])
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
 
 
 @router.post("/conversations", response_model=Conversation)
 async def create_conversation(body: ConversationCreate):
-    db = await get_db()
-    try:
-        conv_id = str(uuid.uuid4())
-        now = datetime.now(timezone.utc).isoformat()
-        await db.execute(
-            """INSERT INTO conversations
+    async with get_write_db() as db:
+        conv_id = str(uuid7())
+        cursor = await db.execute(
+            f"""INSERT INTO conversations
                (id, workspace_id, title, mode, system_prompt, is_pinned, folder, created_at, updated_at)
-               VALUES (?, ?, ?, ?, ?, 0, NULL, ?, ?)""",
-            (conv_id, body.workspace_id, body.title, body.mode, body.system_prompt, now, now),
+               VALUES (?, ?, ?, ?, ?, 0, NULL, {SQL_NOW}, {SQL_NOW})
+               RETURNING {_CONV_COLUMNS}""",
+            (conv_id, body.workspace_id, body.title, body.mode, body.system_prompt),
         )
+        row = await cursor.fetchone()
         await db.commit()
-        return {
-            "id": conv_id,
-            "workspace_id": body.workspace_id,
-            "title": body.title,
-            "mode": body.mode,
-            "system_prompt": body.system_prompt,
-            "is_pinned": False,
-            "folder": None,
-            "tags": [],
-            "created_at": now,
-            "updated_at": now,
-        }
-    finally:
-        await db.close()
+    return _conversation_dict(row, {})
 
 
 @router.patch("/conversations/{conversation_id}", response_model=Conversation)
 async def update_conversation(conversation_id: str, body: ConversationUpdate):
-    db = await get_db()
-    try:
-        cursor = await db.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,))
-        row = await cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-
-        updates = body.model_dump(exclude_none=True)
-        tags = updates.pop("tags", None)
+    updates = body.model_dump(exclude_none=True)
+    tags = updates.pop("tags", None)
 
+    async with get_write_db() as db:
         if updates:
-            set_parts = []
-            values = []
-            for k, v in updates.items():
-                if k == "is_pinned":
-                    set_parts.append(f"{k} = ?")
-                    values.append(1 if v else 0)
-                else:
-                    set_parts.append(f"{k} = ?")
-                    values.append(v)
-            set_parts.append("updated_at = ?")
-            values.append(datetime.now(timezone.utc).isoformat())
-            values.append(conversation_id)
-            await db.execute(
-                f"UPDATE conversations SET {', '.join(set_parts)} WHERE id = ?",
-                values,
+            if "is_pinned" in updates:
+                updates["is_pinned"] = 1 if updates["is_pinned"] else 0
+            columns = tuple(sorted(updates))
+            cursor = await db.execute(
+                _conversation_update_sql(columns),
+                [updates[c] for c in columns] + [conversation_id],
             )
+        else:
+            cursor = await db.execute(f"SELECT {_CONV_COLUMNS} FROM conversations WHERE id = ?", (conversation_id,))
+        row = await cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Conversation not found")
 
         if tags is not None:
             await db.execute("DELETE FROM conversation_tags WHERE conversation_id = ?", (conversation_id,))
-            for tag in tags:
-                await db.execute(
-                    "INSERT INTO conversation_tags (conversation_id, tag) VALUES (?, ?)",
-                    (conversation_id, tag),
-                )
+            await db.executemany(
+                "INSERT INTO conversation_tags (conversation_id, tag) VALUES (?, ?)",
+                [(conversation_id, tag) for tag in tags],
+            )
+            # Same order a read back through the (conversation_id, tag) key gives.
+            tags_by_id = {conversation_id: sorted(tags)}
+        else:
+            tags_by_id = await _load_tags(db, [conversation_id])
 
         await db.commit()
-
-        cursor = await db.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,))
-        updated = await cursor.fetchone()
-    finally:
-        await db.close()
-    return await _enrich_conversation(dict(updated))
+    return _conversation_dict(row, tags_by_id)
 
 
 @router.get("/conversations/{conversation_id}/messages", response_model=list[Message])
 async def get_messages(conversation_id: str):
-    db = await get_db()
-    try:
-        cursor = await db.execute(
-            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC",
-            (conversation_id,),
-        )
-        rows = await cursor.fetchall()
-        result = []
-        for row in rows:
-            d = dict(row)
-            d["sources"] = json.loads(d.get("sources", "[]"))
-            result.append(d)
-        return result
-    finally:
-        await db.close()
+    def encode(rows) -> bytes:
+        return b",".join(_MSG.dump_json(_MSG.validate_python(_message_dict(row))) for row in rows)
+
+    return StreamingResponse(
+        _stream_json_array(_message_batches(_MSG_COLUMNS, conversation_id), encode),
+        media_type="application/json",
+    )
 
 
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str):
-    db = await get_db()
-    try:
-        await db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
-        await db.execute("DELETE FROM conversation_tags WHERE conversation_id = ?", (conversation_id,))
+    async with get_write_db() as db:
+        # messages and conversation_tags go with it via ON DELETE CASCADE.
         result = await db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
         if result.rowcount == 0:
             raise HTTPException(status_code=404, detail="Conversation not found")
         await db.commit()
         return {"deleted": True}
-    finally:
-        await db.close()
 
 
 @router.put("/conversations/{conversation_id}/messages/{message_id}", response_model=Message)
 async def edit_message(conversation_id: str, message_id: str, body: EditMessageRequest):
     """Edit a user message and delete all subsequent messages (for re-send)."""
-    db = await get_db()
-    try:
+    async with get_write_db() as db:
         cursor = await db.execute(
-            "SELECT * FROM messages WHERE id = ? AND conversation_id = ?",
+            "SELECT rowid, role, created_at FROM messages WHERE id = ? AND conversation_id = ?",
             (message_id, conversation_id),
         )
         msg = await cursor.fetchone()
@@ -179,31 +362,24 @@ async def edit_message(conversation_id: str, message_id: str, body: EditMessageR
             raise HTTPException(status_code=400, detail="Only user messages can be edited")
 
         await db.execute(
-            "DELETE FROM messages WHERE conversation_id = ? AND created_at > ?",
-            (conversation_id, msg["created_at"]),
+            "DELETE FROM messages WHERE conversation_id = ? AND (created_at, rowid) > (?, ?)",
+            (conversation_id, msg["created_at"], msg["rowid"]),
         )
-        await db.execute(
-            "UPDATE messages SET content = ? WHERE id = ?",
+        cursor = await db.execute(
+            f"UPDATE messages SET content = ? WHERE id = ? RETURNING {_MSG_COLUMNS}",
             (body.content, message_id),
         )
-        await db.commit()
-
-        cursor = await db.execute("SELECT * FROM messages WHERE id = ?", (message_id,))
         updated = await cursor.fetchone()
-        d = dict(updated)
-        d["sources"] = json.loads(d.get("sources", "[]"))
-        return d
-    finally:
-        await db.close()
+        await db.commit()
+    return _message_dict(updated)
 
 
 @router.post("/conversations/{conversation_id}/regenerate")
 async def regenerate_last_response(conversation_id: str):
     """Delete the last assistant message so a new response can be generated."""
-    db = await get_db()
-    try:
+    async with get_write_db() as db:
         cursor = await db.execute(
-            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at DESC LIMIT 1",
+            "SELECT id, role FROM messages WHERE conversation_id = ? ORDER BY created_at DESC, rowid DESC LIMIT 1",
             (conversation_id,),
         )
         last_msg = await cursor.fetchone()
@@ -214,55 +390,33 @@ async def regenerate_last_response(conversation_id: str):
         await db.commit()
 
         cursor = await db.execute(
-            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at DESC LIMIT 1",
+            f"SELECT {_MSG_COLUMNS} FROM messages WHERE conversation_id = ? ORDER BY created_at DESC, rowid DESC LIMIT 1",
             (conversation_id,),
         )
         last_user = await cursor.fetchone()
-        return {"deleted_message_id": last_msg["id"], "last_user_message": dict(last_user) if last_user else None}
-    finally:
-        await db.close()
+    return {"deleted_message_id": last_msg["id"], "last_user_message": dict(last_user) if last_user else None}
 
 
 @router.get("/conversations/{conversation_id}/export")
 async def export_conversation(conversation_id: str):
     """Export a full conversation as Markdown."""
-    db = await get_db()
-    try:
-        cursor = await db.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,))
+    async with get_read_db() as db:
+        cursor = await db.execute("SELECT title, mode, system_prompt FROM conversations WHERE id = ?", (conversation_id,))
         conv = await cursor.fetchone()
-        if not conv:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-
-        cursor = await db.execute(
-            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC",
-            (conversation_id,),
-        )
-        messages = await cursor.fetchall()
-    finally:
-        await db.close()
-
-    lines = [f"# {conv['title']}", f"*Exported from Local AI Workspace*", f"*Mode: {conv['mode']}*", ""]
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
+    header = [f"# {conv['title']}", f"*Exported from Local AI Workspace*", f"*Mode: {conv['mode']}*", ""]
     if conv["system_prompt"]:
-        lines.extend(["## System Prompt", "", conv["system_prompt"], "---", ""])
+        header.extend(["## System Prompt", "", conv["system_prompt"], "---", ""])
 
-    for msg in messages:
-        role_label = "You" if msg["role"] == "user" else "Assistant"
-        lines.append(f"### {role_label}")
-        lines.append("")
-        lines.append(msg["content"])
-        sources = json.loads(msg.get("sources", "[]"))
-        if sources:
-            lines.append("")
-            lines.append("**Sources:**")
-            for i, s in enumerate(sources, 1):
-                page_info = f" (p. {s.get('page', '')})" if s.get("page") else ""
-                lines.append(f"- [{i}] {s['filename']}{page_info}")
-        lines.extend(["", "---", ""])
-
-    md_content = "\n".join(lines)
-    return Response(
-        content=md_content,
+    async def markdown():
+        yield "\n".join(header).encode()
+        async for rows in _message_batches("role, content, sources", conversation_id):
+            yield "".join("\n" + "\n".join(_export_section(msg)) for msg in rows).encode()
+
+    return StreamingResponse(
+        markdown(),
         media_type="text/markdown",
         headers={"Content-Disposition": f'attachment; filename="{conv["title"][:50]}.md"'},
     )
@@ -271,54 +425,36 @@ async def export_conversation(conversation_id: str):
 @router.get("/search", response_model=list[ConversationSearchResult])
 async def search_conversations(q: str = Query(..., min_length=1)):
     """Full-text search across all conversations."""
-    db = await get_db()
-    try:
-        search_term = f"%{q}%"
+    match = _fts_query(q)
+    if not match:
+        return []
+    async with get_read_db() as db:
         cursor = await db.execute(
-            """SELECT m.id as message_id, m.conversation_id, m.role, m.content, m.created_at,
-                      c.title as conversation_title
-               FROM messages m
-               JOIN conversations c ON m.conversation_id = c.id
-               WHERE m.content LIKE ?
-               ORDER BY m.created_at DESC
+            """SELECT m.conversation_id, c.title AS conversation_title, m.id AS message_id,
+                      m.role,
+                      snippet(messages_fts, 0, '', '', '...', 20) AS match_preview,
+                      m.created_at
+               FROM messages_fts
+               JOIN messages m ON m.rowid = messages_fts.rowid
+               JOIN conversations c ON c.id = m.conversation_id
+               WHERE messages_fts MATCH ?
+               ORDER BY rank
                LIMIT 50""",
-            (search_term,),
+            (match,),
         )
         rows = await cursor.fetchall()
-        results = []
-        for row in rows:
-            d = dict(row)
-            content = d["content"]
-            idx = content.lower().find(q.lower())
-            start = max(0, idx - 50)
-            end = min(len(content), idx + len(q) + 50)
-            preview = ("..." if start > 0 else "") + content[start:end] + ("..." if end < len(content) else "")
-            results.append({
-                "conversation_id": d["conversation_id"],
-                "conversation_title": d["conversation_title"],
-                "message_id": d["message_id"],
-                "role": d["role"],
-                "content": d["content"],
-                "match_preview": preview,
-                "created_at": d["created_at"],
-            })
-        return results
-    finally:
-        await db.close()
+    return [dict(row) for row in rows]
 
 
 @router.get("/folders")
 async def list_folders():
     """Get all unique folder names."""
-    db = await get_db()
-    try:
+    async with get_read_db() as db:
         cursor = await db.execute(
             "SELECT DISTINCT folder FROM conversations WHERE folder IS NOT NULL AND folder != '' ORDER BY folder"
         )
         rows = await cursor.fetchall()
-        return [row["folder"] for row in rows]
-    finally:
-        await db.close()
+    return [row["folder"] for row in rows]
 
 
 @router.post("/debug/retrieve")
@@ -341,16 +477,31 @@ async def debug_retrieve(workspace_id: str, query: str, strategy: str = "vector"
             "strategy": strategy,
             "total_results": len(results),
             "results": results,
-            "confidence_breakdown": {
-                "high": sum(1 for r in results if r.get("confidence") == "high"),
-                "medium": sum(1 for r in results if r.get("confidence") == "medium"),
-                "low": sum(1 for r in results if r.get("confidence") == "low"),
-            }
+            "confidence_breakdown": _confidence_breakdown(results),
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _fetch_history(conversation_id: str) -> list:
+    """
+    Load a conversation's messages as (role, content) rows.
+
+    One query answers both "does the conversation exist" (no rows) and
+    "what is its history" (a single all-NULL row means it has none).
+    """
+    async with get_read_db() as db:
+        cursor = await db.execute(
+            """SELECT m.role, m.content
+               FROM conversations c
+               LEFT JOIN messages m ON m.conversation_id = c.id
+               WHERE c.id = ?
+               ORDER BY m.created_at ASC, m.rowid ASC""",
+            (conversation_id,),
+        )
+        return await cursor.fetchall()
+
+
 @router.post("/send")
 async def send_message(body: ChatRequest):
     model = body.model or settings.default_chat_model
@@ -360,94 +511,68 @@ async def send_message(body: ChatRequest):
     retrieval_strategy = getattr(body, 'retrieval_strategy', 'vector')
     show_debug_context = getattr(body, 'show_debug_context', False)
 
-    db = await get_db()
-    try:
-        cursor = await db.execute(
-            "SELECT * FROM conversations WHERE id = ?", (body.conversation_id,)
+    # History and retrieval are independent I/O, so run them concurrently.
+    if body.mode == "workspace" and body.workspace_id:
+        history_rows, search_results = await asyncio.gather(
+            _fetch_history(body.conversation_id),
+            rag.search(
+                workspace_id=body.workspace_id,
+                query=body.message,
+                strategy=retrieval_strategy,
+                use_recursive=getattr(body, 'use_recursive_retrieval', False),
+            ),
         )
-        conv = await cursor.fetchone()
-        if not conv:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-    finally:
-        await db.close()
+    else:
+        history_rows, search_results = await _fetch_history(body.conversation_id), None
+    if not history_rows:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
-    msg_cursor = await (await get_db()).execute(
-        "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY created_at ASC",
-        (body.conversation_id,),
-    )
-    history_rows = await msg_cursor.fetchall()
-    await msg_cursor.connection.close()
+    history = [{"role": role, "content": content} for role, content in history_rows if role is not None]
 
-    history = [{"role": r["role"], "content": r["content"]} for r in history_rows]
-
-    sources = []
+    sources = search_results or []
+    breakdown = _confidence_breakdown(sources)
     context_text = ""
     retrieval_metadata = {}
 
-    if body.mode == "workspace" and body.workspace_id:
-        # Use advanced RAG search with configurable strategy
-        search_results = await rag.search(
-            workspace_id=body.workspace_id,
-            query=body.message,
-            strategy=retrieval_strategy,
-            use_recursive=getattr(body, 'use_recursive_retrieval', False),
-        )
-        sources = search_results
-
+    if search_results is not None:
         # Store metadata for debug view
         retrieval_metadata = {
             "strategy": retrieval_strategy,
             "total_results": len(sources),
-            "confidence_breakdown": {
-                "high": sum(1 for s in sources if s.get("confidence") == "high"),
-                "medium": sum(1 for s in sources if s.get("confidence") == "medium"),
-                "low": sum(1 for s in sources if s.get("confidence") == "low"),
-            }
+            "confidence_breakdown": breakdown,
         }
 
         if sources:
-            context_parts = []
-            for i, s in enumerate(sources, 1):
-                page_info = f" (page {s['page']})" if s.get("page") else ""
-                confidence = s.get("confidence", "unknown")
-                score = s.get("score", 0)
-                context_parts.append(
-                    f"[{i}] {s['filename']}{page_info} [confidence: {confidence}, score: {score:.3f}]:\n{s['chunk_text']}"
-                )
-            context_text = "\n\n".join(context_parts)
+            context_text = "\n\n".join(
+                _context_entry(i, s) for i, s in enumerate(sources, 1)
+            )
 
     system = body.system_prompt or ""
     if body.mode == "workspace" and context_text:
-        rag_instruction = (
-            "Answer the user's question based on the following document excerpts. "
-            "Use inline citations like [1], [2], etc. to reference specific sources. "
-            "If the documents don't contain relevant information, say so clearly.\n\n"
-            f"--- DOCUMENTS ---\n{context_text}\n--- END DOCUMENTS ---"
-        )
+        rag_instruction = "".join((_RAG_PREFIX, context_text, _RAG_SUFFIX))
         system = f"{system}\n\n{rag_instruction}" if system else rag_instruction
 
-    user_msg_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-    db = await get_db()
-    try:
-        await db.execute(
-            "INSERT INTO messages (id, conversation_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
-            (user_msg_id, body.conversation_id, "user", body.message, now),
-        )
-        await db.execute(
-            "UPDATE conversations SET updated_at = ? WHERE id = ?",
-            (now, body.conversation_id),
-        )
-
-        if len(history) == 0:
-            title = body.message[:60] + ("..." if len(body.message) > 60 else "")
+    user_msg_id = str(uuid7())
+    async with get_write_db() as db:
+        # Take the write lock up front so the burst below commits as one unit.
+        await db.execute("BEGIN IMMEDIATE")
+        try:
             await db.execute(
-                "UPDATE conversations SET title = ? WHERE id = ?",
-                (title, body.conversation_id),
+                f"INSERT INTO messages (id, conversation_id, role, content, created_at) VALUES (?, ?, ?, ?, {SQL_NOW})",
+                (user_msg_id, body.conversation_id, "user", body.message),
             )
+        except aiosqlite.IntegrityError:
+            # The conversation was deleted after the history read above.
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        # The first message also names the conversation; a NULL title keeps the current one.
+        title = None
+        if not history:
+            title = body.message[:60] + ("..." if len(body.message) > 60 else "")
+        await db.execute(
+            f"UPDATE conversations SET updated_at = {SQL_NOW}, title = COALESCE(?, title) WHERE id = ?",
+            (title, body.conversation_id),
+        )
         await db.commit()
-    finally:
-        await db.close()
 
     messages = []
     if system:
@@ -455,61 +580,99 @@ async def send_message(body: ChatRequest):
     messages.extend(history)
     messages.append({"role": "user", "content": body.message})
 
-    assistant_msg_id = str(uuid.uuid4())
+    assistant_msg_id = str(uuid7())
+
+    source_list = [
+        {
+            "filename": s["filename"],
+            "chunk_text": s["chunk_text"][:200],
+            "full_chunk_text": s["chunk_text"],  # Store full text for highlighting
+            "page": s.get("page"),
+            "score": s.get("score", 0),
+            "confidence": s.get("confidence", "unknown"),
+            "doc_id": s.get("doc_id", ""),
+        }
+        for s in sources
+    ]
+
+    # Serialised once: stored in the row and embedded as-is in the done frame.
+    sources_json = orjson.dumps(source_list)
+
+    # Calculate overall confidence
+    overall_confidence = "high"
+    if sources:
+        if breakdown["high"] < len(sources) / 2:
+            overall_confidence = "medium"
+        if breakdown["low"] == len(sources):
+            overall_confidence = "low"
 
     async def stream_response():
-        full_response = ""
+        parts: list[str] = []
+        pending: list[str] = []
+        pending_len = 0
+        last_flush = 0.0
+        loop = asyncio.get_running_loop()
+        tokens = ollama.chat_stream(model, messages, temperature)
+        # The next token is awaited as a task so a flush deadline can pass
+        # without cancelling (and so closing) the stream underneath it.
+        next_token = asyncio.ensure_future(anext(tokens, None))
         try:
-            async for chunk in ollama.chat_stream(model, messages, temperature):
-                full_response += chunk
-                payload = json.dumps({"type": "chunk", "content": chunk})
-                yield f"data: {payload}\n\n"
-
-            source_list = [
-                {
-                    "filename": s["filename"],
-                    "chunk_text": s["chunk_text"][:200],
-                    "full_chunk_text": s["chunk_text"],  # Store full text for highlighting
-                    "page": s.get("page"),
-                    "score": s.get("score", 0),
-                    "confidence": s.get("confidence", "unknown"),
-                    "doc_id": s.get("doc_id", ""),
-                }
-                for s in sources
-            ]
-
-            db2 = await get_db()
-            try:
-                now2 = datetime.now(timezone.utc).isoformat()
-                await db2.execute(
-                    "INSERT INTO messages (id, conversation_id, role, content, sources, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                    (assistant_msg_id, body.conversation_id, "assistant", full_response, json.dumps(source_list), now2),
+            while True:
+                if pending:
+                    # Buffered tokens go out once the interval is up, even if
+                    # the model pauses before its next token.
+                    timeout = max(last_flush + SSE_FLUSH_INTERVAL - loop.time(), 0)
+                    done, _ = await asyncio.wait({next_token}, timeout=timeout)
+                    if not done:
+                        yield _chunk_frame("".join(pending))
+                        pending.clear()
+                        pending_len = 0
+                        last_flush = loop.time()
+                        continue
+                chunk = await next_token
+                if chunk is None:
+                    break
+                next_token = asyncio.ensure_future(anext(tokens, None))
+                parts.append(chunk)
+                pending.append(chunk)
+                pending_len += len(chunk)
+                # Coalesce fast token bursts into fewer frames; the first token
+                # always goes out immediately since last_flush starts at 0.
+                if pending_len >= SSE_FLUSH_CHARS or loop.time() - last_flush >= SSE_FLUSH_INTERVAL:
+                    yield _chunk_frame("".join(pending))
+                    pending.clear()
+                    pending_len = 0
+                    last_flush = loop.time()
+            if pending:
+                yield _chunk_frame("".join(pending))
+            full_response = "".join(parts)
+
+            async with get_write_db() as write_db:
+                await write_db.execute("BEGIN IMMEDIATE")
+                await write_db.execute(
+                    f"INSERT INTO messages (id, conversation_id, role, content, sources, created_at) VALUES (?, ?, ?, ?, ?, {SQL_NOW})",
+                    (assistant_msg_id, body.conversation_id, "assistant", full_response, sources_json.decode()),
                 )
-                await db2.commit()
-            finally:
-                await db2.close()
-
-            # Calculate overall confidence
-            overall_confidence = "high"
-            if sources:
-                high_count = sum(1 for s in sources if s.get("confidence") == "high")
-                if high_count < len(sources) / 2:
-                    overall_confidence = "medium"
-                if all(s.get("confidence") == "low" for s in sources):
-                    overall_confidence = "low"
-
-            done_payload = json.dumps({
+                await write_db.execute(
+                    f"UPDATE conversations SET updated_at = {SQL_NOW} WHERE id = ?",
+                    (body.conversation_id,),
+                )
+                await write_db.commit()
+
+            yield _event_frame({
                 "type": "done",
                 "message_id": assistant_msg_id,
-                "sources": source_list,
+                "sources": orjson.Fragment(sources_json),
                 "confidence": overall_confidence,
                 "retrieval_metadata": retrieval_metadata if show_debug_context else None,
             })
-            yield f"data: {done_payload}\n\n"
 
         except Exception as e:
-            error_payload = json.dumps({"type": "error", "content": str(e)})
-            yield f"data: {error_payload}\n\n"
+            yield _event_frame({"type": "error", "content": str(e)})
+        finally:
+            # Stops pulling from the model if the client went away mid-stream;
+            # a no-op once the stream has ended.
+            next_token.cancel()
 
     return StreamingResponse(
         stream_response(),
@@ -1,37 +1,104 @@
+import asyncio
 import uuid
 import hashlib
 import logging
-from datetime import datetime, timezone
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, HTTPException, UploadFile, File, Form
 
-from database import get_db
+from database import SQL_NOW, get_read_db, get_write_db
 from models import Document
 from config import settings
 from services.document_service import DocumentService
-from utils.text_extraction import extract_text
+from utils.text_extraction import extract_text, forget_extraction
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 doc_service = DocumentService()
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+PREVIEW_CHARS = 5000
+
+# Columns backing the Document model.
+_DOC_COLUMNS = (
+    "id, workspace_id, filename, file_path, file_hash, file_size, "
+    "chunk_count, status, error_message, created_at"
+)
+
 
 @router.get("/{workspace_id}", response_model=list[Document])
 async def list_documents(workspace_id: str):
-    db = await get_db()
-    try:
+    async with get_read_db() as db:
         cursor = await db.execute(
-            "SELECT * FROM documents WHERE workspace_id = ? ORDER BY created_at DESC",
+            f"SELECT {_DOC_COLUMNS} FROM documents WHERE workspace_id = ? ORDER BY created_at DESC",
             (workspace_id,),
         )
         rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        await db.close()
+    return [dict(row) for row in rows]
+
+
+async def _ingest_and_update(
+    workspace_id: str,
+    doc_id: str,
+    file_path: str,
+    filename: str,
+    chunk_size: int,
+    chunk_overlap: int,
+):
+    """Ingest an uploaded document and record the outcome on its row."""
+    try:
+        chunk_count = await doc_service.ingest(
+            workspace_id=workspace_id,
+            doc_id=doc_id,
+            file_path=file_path,
+            filename=filename,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+        )
+    except Exception as e:
+        logger.error("Ingestion failed for %s: %s", filename, e)
+        async with get_write_db() as db:
+            await db.execute(
+                "UPDATE documents SET status = 'error', error_message = ? WHERE id = ?",
+                (str(e), doc_id),
+            )
+            await db.commit()
+        return
 
+    async with get_write_db() as db:
+        cursor = await db.execute(
+            "UPDATE documents SET status = 'ready', chunk_count = ? WHERE id = ?",
+            (chunk_count, doc_id),
+        )
+        await db.commit()
 
-@router.post("/upload")
+    if cursor.rowcount == 0:
+        # The row went away mid-ingest (its workspace was deleted); don't
+        # leave its chunks searchable.
+        try:
+            await doc_service.remove_document(workspace_id, doc_id)
+        except Exception as e:
+            logger.warning("Failed to remove vectors for deleted doc %s: %s", doc_id, e)
+
+
+async def _document_conflict(db, workspace_id: str, doc_id: str) -> HTTPException:
+    """404 if the document doesn't exist, otherwise 409 because it is still processing."""
+    cursor = await db.execute(
+        "SELECT 1 FROM documents WHERE id = ? AND workspace_id = ?",
+        (doc_id, workspace_id),
+    )
+    if await cursor.fetchone() is None:
+        return HTTPException(status_code=404, detail="Document not found")
+    return HTTPException(status_code=409, detail="Document is still being processed")
+
+
+def _write_chunk(out, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+@router.post("/upload", status_code=202)
 async def upload_document(
+    background: BackgroundTasks,
     workspace_id: str = Form(...),
     chunk_size: int = Form(None),
     chunk_overlap: int = Form(None),
@@ -48,113 +115,92 @@ async def upload_document(
             detail=f"Unsupported file type '.{ext}'. Supported: {', '.join(supported)}",
         )
 
-    content = await file.read()
+    doc_id = str(uuid.uuid4())
+    ws_dir = settings.workspace_dir(workspace_id)
+    file_path = ws_dir / "documents" / f"{doc_id}_{file.filename}"
+    file_path.parent.mkdir(parents=True, exist_ok=True)
 
-    if len(content) > settings.max_file_size_mb * 1024 * 1024:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File exceeds maximum size of {settings.max_file_size_mb}MB",
-        )
+    # Stream the upload to disk while hashing it, so the whole body is never
+    # held in memory and oversized files are rejected as soon as they cross
+    # the limit. Hashing and disk writes run in a worker thread so a large
+    # upload doesn't stall other requests.
+    max_bytes = settings.max_file_size_mb * 1024 * 1024
+    hasher = hashlib.sha256()
+    file_size = 0
+    try:
+        with open(file_path, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > max_bytes:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File exceeds maximum size of {settings.max_file_size_mb}MB",
+                    )
+                await asyncio.to_thread(_write_chunk, out, hasher, chunk)
 
-    file_hash = hashlib.sha256(content).hexdigest()
+        file_hash = hasher.hexdigest()
 
-    db = await get_db()
-    try:
-        cursor = await db.execute(
-            "SELECT id FROM documents WHERE workspace_id = ? AND file_hash = ?",
-            (workspace_id, file_hash),
-        )
-        existing = await cursor.fetchone()
+        async with get_read_db() as db:
+            cursor = await db.execute(
+                "SELECT id FROM documents WHERE workspace_id = ? AND file_hash = ?",
+                (workspace_id, file_hash),
+            )
+            existing = await cursor.fetchone()
         if existing:
             raise HTTPException(
                 status_code=409,
                 detail="This file has already been ingested in this workspace",
             )
-    finally:
-        await db.close()
-
-    doc_id = str(uuid.uuid4())
-    ws_dir = settings.workspace_dir(workspace_id)
-    file_path = ws_dir / "documents" / f"{doc_id}_{file.filename}"
-    file_path.parent.mkdir(parents=True, exist_ok=True)
-    file_path.write_bytes(content)
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
 
-    now = datetime.now(timezone.utc).isoformat()
-    db = await get_db()
-    try:
+    async with get_write_db() as db:
         await db.execute(
-            """INSERT INTO documents
+            f"""INSERT INTO documents
                (id, workspace_id, filename, file_path, file_hash, file_size, status, created_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (doc_id, workspace_id, file.filename, str(file_path), file_hash, len(content), "processing", now),
+               VALUES (?, ?, ?, ?, ?, ?, ?, {SQL_NOW})""",
+            (doc_id, workspace_id, file.filename, str(file_path), file_hash, file_size, "processing"),
         )
         await db.commit()
-    finally:
-        await db.close()
-
-    try:
-        chunk_count = await doc_service.ingest(
-            workspace_id=workspace_id,
-            doc_id=doc_id,
-            file_path=str(file_path),
-            filename=file.filename,
-            chunk_size=chunk_size or settings.chunk_size,
-            chunk_overlap=chunk_overlap or settings.chunk_overlap,
-        )
 
-        db = await get_db()
-        try:
-            await db.execute(
-                "UPDATE documents SET status = 'ready', chunk_count = ? WHERE id = ?",
-                (chunk_count, doc_id),
-            )
-            await db.commit()
-        finally:
-            await db.close()
-
-        return {
-            "id": doc_id,
-            "filename": file.filename,
-            "status": "ready",
-            "chunk_count": chunk_count,
-        }
-
-    except Exception as e:
-        logger.error("Ingestion failed for %s: %s", file.filename, e)
-        db = await get_db()
-        try:
-            await db.execute(
-                "UPDATE documents SET status = 'error', error_message = ? WHERE id = ?",
-                (str(e), doc_id),
-            )
-            await db.commit()
-        finally:
-            await db.close()
-        raise HTTPException(status_code=500, detail=f"Ingestion failed: {e}")
+    background.add_task(
+        _ingest_and_update,
+        workspace_id=workspace_id,
+        doc_id=doc_id,
+        file_path=str(file_path),
+        filename=file.filename,
+        chunk_size=chunk_size or settings.chunk_size,
+        chunk_overlap=chunk_overlap or settings.chunk_overlap,
+    )
+    return {"id": doc_id, "filename": file.filename, "status": "processing"}
 
 
 @router.delete("/{workspace_id}/{doc_id}")
 async def delete_document(workspace_id: str, doc_id: str):
-    db = await get_db()
-    try:
+    async with get_write_db() as db:
+        # A document still being ingested would get the rest of its chunks
+        # written after they were removed, so it can't be deleted yet.
         cursor = await db.execute(
-            "SELECT * FROM documents WHERE id = ? AND workspace_id = ?",
+            """DELETE FROM documents WHERE id = ? AND workspace_id = ? AND status != 'processing'
+               RETURNING file_path""",
             (doc_id, workspace_id),
         )
         doc = await cursor.fetchone()
         if not doc:
-            raise HTTPException(status_code=404, detail="Document not found")
-
-        await db.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            raise await _document_conflict(db, workspace_id, doc_id)
         await db.commit()
-    finally:
-        await db.close()
 
     try:
         await doc_service.remove_document(workspace_id, doc_id)
     except Exception as e:
         logger.warning("Failed to remove vectors for doc %s: %s", doc_id, e)
 
+    try:
+        forget_extraction(doc["file_path"])
+    except OSError as e:
+        logger.warning("Failed to drop cached text for doc %s: %s", doc_id, e)
+
     return {"deleted": True}
 
 
@@ -166,23 +212,19 @@ async def reingest_document(
     chunk_overlap: int = Form(None),
 ):
     """Re-ingest a document with new chunking settings."""
-    db = await get_db()
-    try:
+    async with get_write_db() as db:
+        # Claiming the row atomically keeps a re-ingest from racing an
+        # ingest (or another re-ingest) that is still writing chunks.
         cursor = await db.execute(
-            "SELECT * FROM documents WHERE id = ? AND workspace_id = ?",
+            """UPDATE documents SET status = 'processing', error_message = NULL
+               WHERE id = ? AND workspace_id = ? AND status != 'processing'
+               RETURNING filename, file_path""",
             (doc_id, workspace_id),
         )
         doc = await cursor.fetchone()
         if not doc:
-            raise HTTPException(status_code=404, detail="Document not found")
-
-        await db.execute(
-            "UPDATE documents SET status = 'processing', error_message = NULL WHERE id = ?",
-            (doc_id,),
-        )
+            raise await _document_conflict(db, workspace_id, doc_id)
         await db.commit()
-    finally:
-        await db.close()
 
     try:
         await doc_service.remove_document(workspace_id, doc_id)
@@ -198,56 +240,68 @@ async def reingest_document(
             chunk_size=chunk_size or settings.chunk_size,
             chunk_overlap=chunk_overlap or settings.chunk_overlap,
         )
-        db = await get_db()
-        try:
+        async with get_write_db() as db:
             await db.execute(
                 "UPDATE documents SET status = 'ready', chunk_count = ? WHERE id = ?",
                 (chunk_count, doc_id),
             )
             await db.commit()
-        finally:
-            await db.close()
         return {"status": "ready", "chunk_count": chunk_count}
     except Exception as e:
         logger.error("Re-ingestion failed for %s: %s", doc["filename"], e)
-        db = await get_db()
-        try:
+        async with get_write_db() as db:
             await db.execute(
                 "UPDATE documents SET status = 'error', error_message = ? WHERE id = ?",
                 (str(e), doc_id),
             )
             await db.commit()
-        finally:
-            await db.close()
         raise HTTPException(status_code=500, detail=f"Re-ingestion failed: {e}")
 
 
+def _build_preview(file_path: str) -> tuple[str, int, int]:
+    """
+    Extract a document and return (preview, total_chars, total_pages).
+
+    Totals are computed from page lengths, and only as many pages as the
+    preview needs are joined, instead of building the full text and slicing.
+    """
+    page_texts = extract_text(file_path)
+    separator = "\n\n"
+    total_chars = sum(len(text) for _, text in page_texts) + len(separator) * max(len(page_texts) - 1, 0)
+
+    parts: list[str] = []
+    size = 0
+    for _, text in page_texts:
+        if parts:
+            parts.append(separator)
+            size += len(separator)
+        parts.append(text)
+        size += len(text)
+        if size >= PREVIEW_CHARS:
+            break
+    return "".join(parts)[:PREVIEW_CHARS], total_chars, len(page_texts)
+
+
 @router.get("/{workspace_id}/{doc_id}/preview")
 async def preview_document(workspace_id: str, doc_id: str):
     """Preview extracted text from a document."""
-    db = await get_db()
-    try:
+    async with get_read_db() as db:
         cursor = await db.execute(
-            "SELECT * FROM documents WHERE id = ? AND workspace_id = ?",
+            "SELECT filename, file_path FROM documents WHERE id = ? AND workspace_id = ?",
             (doc_id, workspace_id),
         )
         doc = await cursor.fetchone()
-        if not doc:
-            raise HTTPException(status_code=404, detail="Document not found")
-    finally:
-        await db.close()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
 
     try:
-        page_texts = extract_text(doc["file_path"])
-        full_text = "\n\n".join(text for _, text in page_texts)
-        total_pages = len(page_texts)
-        preview = full_text[:5000]
-        return {
-            "filename": doc["filename"],
-            "total_chars": len(full_text),
-            "total_pages": total_pages,
-            "preview": preview,
-            "truncated": len(full_text) > 5000,
-        }
+        preview, total_chars, total_pages = await asyncio.to_thread(_build_preview, doc["file_path"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Preview failed: {e}")
+    return {
+        "filename": doc["filename"],
+        "total_chars": total_chars,
+        "total_pages": total_pages,
+        "preview": preview,
+        "truncated": total_chars > PREVIEW_CHARS,
+    }
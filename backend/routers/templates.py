@@ -1,11 +1,12 @@
-import json
-import uuid
+import orjson
 from datetime import datetime, timezone
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 
-from database import get_db
+from database import SQL_NOW, get_read_db, get_write_db
 from models import PromptTemplate, PromptTemplateCreate, PromptTemplateUpdate
+from utils.ids import uuid7
 
 router = APIRouter()
 
@@ -77,35 +78,37 @@ BUILTIN_TEMPLATES = [
 ]
 
 
-async def _seed_builtins():
-    db = await get_db()
-    try:
-        for tmpl in BUILTIN_TEMPLATES:
-            cursor = await db.execute("SELECT id FROM prompt_templates WHERE id = ?", (tmpl["id"],))
-            exists = await cursor.fetchone()
-            if not exists:
-                now = datetime.now(timezone.utc).isoformat()
-                await db.execute(
-                    """INSERT INTO prompt_templates (id, name, content, category, is_builtin, variables, created_at, updated_at)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (tmpl["id"], tmpl["name"], tmpl["content"], tmpl["category"],
-                     1, json.dumps(tmpl["variables"]), now, now),
-                )
-        await db.commit()
-    finally:
-        await db.close()
+# Seed parameters for the built-ins, built once at import.
+_BUILTIN_ROWS = tuple(
+    (tmpl["id"], tmpl["name"], tmpl["content"], tmpl["category"], orjson.dumps(tmpl["variables"]).decode())
+    for tmpl in BUILTIN_TEMPLATES
+)
+
+_seeded = False
 
 
-@router.on_event("startup")
-async def startup():
-    await _seed_builtins()
+async def seed_builtins():
+    """Insert any missing built-in templates; a no-op once it has succeeded."""
+    global _seeded
+    if _seeded:
+        return
+    async with get_write_db() as db:
+        await db.executemany(
+            f"""INSERT OR IGNORE INTO prompt_templates
+               (id, name, content, category, is_builtin, variables, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 1, ?, {SQL_NOW}, {SQL_NOW})""",
+            _BUILTIN_ROWS,
+        )
+        await db.commit()
+    _seeded = True
 
 
 @router.get("/", response_model=list[PromptTemplate])
 async def list_templates(category: str | None = None):
-    await _seed_builtins()
-    db = await get_db()
-    try:
+    # Normally seeded at startup; only a request that beats it pays for this.
+    if not _seeded:
+        await seed_builtins()
+    async with get_read_db() as db:
         if category:
             cursor = await db.execute(
                 "SELECT * FROM prompt_templates WHERE category = ? ORDER BY is_builtin DESC, name ASC",
@@ -116,27 +119,18 @@ async def list_templates(category: str | None = None):
                 "SELECT * FROM prompt_templates ORDER BY is_builtin DESC, name ASC"
             )
         rows = await cursor.fetchall()
-        result = []
-        for row in rows:
-            d = dict(row)
-            d["is_builtin"] = bool(d.get("is_builtin", 0))
-            d["variables"] = json.loads(d.get("variables", "[]"))
-            result.append(d)
-        return result
-    finally:
-        await db.close()
+    return [_template_dict(row) for row in rows]
 
 
 @router.post("/", response_model=PromptTemplate)
 async def create_template(body: PromptTemplateCreate):
-    db = await get_db()
-    try:
-        tmpl_id = str(uuid.uuid4())
+    async with get_write_db() as db:
+        tmpl_id = str(uuid7())
         now = datetime.now(timezone.utc).isoformat()
         await db.execute(
             """INSERT INTO prompt_templates (id, name, content, category, is_builtin, variables, created_at, updated_at)
                VALUES (?, ?, ?, ?, 0, ?, ?, ?)""",
-            (tmpl_id, body.name, body.content, body.category, json.dumps(body.variables), now, now),
+            (tmpl_id, body.name, body.content, body.category, orjson.dumps(body.variables).decode(), now, now),
         )
         await db.commit()
         return {
@@ -149,101 +143,96 @@ async def create_template(body: PromptTemplateCreate):
             "created_at": now,
             "updated_at": now,
         }
-    finally:
-        await db.close()
+
+
+async def _reject_missing_or_builtin(db, template_id: str, action: str):
+    """Raise the right error after a write that skipped built-ins matched nothing."""
+    cursor = await db.execute("SELECT is_builtin FROM prompt_templates WHERE id = ?", (template_id,))
+    row = await cursor.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Template not found")
+    raise HTTPException(status_code=400, detail=f"Cannot {action} built-in templates")
+
+
+def _template_dict(row) -> dict:
+    d = dict(row)
+    d["is_builtin"] = bool(d.get("is_builtin", 0))
+    d["variables"] = orjson.loads(d.get("variables") or "[]")
+    return d
 
 
 @router.put("/{template_id}", response_model=PromptTemplate)
 async def update_template(template_id: str, body: PromptTemplateUpdate):
-    db = await get_db()
-    try:
-        cursor = await db.execute("SELECT * FROM prompt_templates WHERE id = ?", (template_id,))
-        row = await cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Template not found")
-        if row["is_builtin"]:
-            raise HTTPException(status_code=400, detail="Cannot edit built-in templates")
-
-        updates = body.model_dump(exclude_none=True)
-        if "variables" in updates:
-            updates["variables"] = json.dumps(updates["variables"])
+    updates = body.model_dump(exclude_none=True)
+    if "variables" in updates:
+        updates["variables"] = orjson.dumps(updates["variables"]).decode()
 
+    async with get_write_db() as db:
         if updates:
             set_parts = [f"{k} = ?" for k in updates]
             set_parts.append("updated_at = ?")
             values = list(updates.values())
             values.append(datetime.now(timezone.utc).isoformat())
             values.append(template_id)
-            await db.execute(
-                f"UPDATE prompt_templates SET {', '.join(set_parts)} WHERE id = ?",
+            cursor = await db.execute(
+                f"UPDATE prompt_templates SET {', '.join(set_parts)} WHERE id = ? AND is_builtin = 0 RETURNING *",
                 values,
             )
-            await db.commit()
-
-        cursor = await db.execute("SELECT * FROM prompt_templates WHERE id = ?", (template_id,))
-        updated = await cursor.fetchone()
-        d = dict(updated)
-        d["is_builtin"] = bool(d.get("is_builtin", 0))
-        d["variables"] = json.loads(d.get("variables", "[]"))
-        return d
-    finally:
-        await db.close()
+        else:
+            cursor = await db.execute(
+                "SELECT * FROM prompt_templates WHERE id = ? AND is_builtin = 0", (template_id,)
+            )
+        row = await cursor.fetchone()
+        if not row:
+            await _reject_missing_or_builtin(db, template_id, "edit")
+        await db.commit()
+    return _template_dict(row)
 
 
 @router.delete("/{template_id}")
 async def delete_template(template_id: str):
-    db = await get_db()
-    try:
-        cursor = await db.execute("SELECT * FROM prompt_templates WHERE id = ?", (template_id,))
-        row = await cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Template not found")
-        if row["is_builtin"]:
-            raise HTTPException(status_code=400, detail="Cannot delete built-in templates")
-
-        await db.execute("DELETE FROM prompt_templates WHERE id = ?", (template_id,))
+    async with get_write_db() as db:
+        result = await db.execute(
+            "DELETE FROM prompt_templates WHERE id = ? AND is_builtin = 0", (template_id,)
+        )
+        if result.rowcount == 0:
+            await _reject_missing_or_builtin(db, template_id, "delete")
         await db.commit()
-        return {"deleted": True}
-    finally:
-        await db.close()
+    return {"deleted": True}
 
 
 @router.get("/export")
 async def export_templates():
-    db = await get_db()
-    try:
+    async with get_read_db() as db:
         cursor = await db.execute(
-            "SELECT * FROM prompt_templates WHERE is_builtin = 0 ORDER BY name"
+            """SELECT id, name, content, category, variables, created_at, updated_at
+               FROM prompt_templates WHERE is_builtin = 0 ORDER BY name"""
         )
         rows = await cursor.fetchall()
-        templates = []
-        for row in rows:
-            d = dict(row)
-            d["variables"] = json.loads(d.get("variables", "[]"))
-            del d["is_builtin"]
-            templates.append(d)
-        return {"templates": templates}
-    finally:
-        await db.close()
+    # variables is stored as JSON already; embed it verbatim instead of
+    # parsing it only to serialize it again.
+    templates = [
+        {**dict(row), "variables": orjson.Fragment(row["variables"] or "[]")}
+        for row in rows
+    ]
+    return ORJSONResponse({"templates": templates})
 
 
 @router.post("/import")
 async def import_templates(data: dict):
     templates = data.get("templates", [])
-    imported = 0
-    db = await get_db()
-    try:
-        for tmpl in templates:
-            tmpl_id = str(uuid.uuid4())
-            now = datetime.now(timezone.utc).isoformat()
-            await db.execute(
-                """INSERT INTO prompt_templates (id, name, content, category, is_builtin, variables, created_at, updated_at)
-                   VALUES (?, ?, ?, ?, 0, ?, ?, ?)""",
-                (tmpl_id, tmpl["name"], tmpl["content"], tmpl.get("category", "custom"),
-                 json.dumps(tmpl.get("variables", [])), now, now),
-            )
-            imported += 1
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [
+        (str(uuid7()), tmpl["name"], tmpl["content"], tmpl.get("category", "custom"),
+         orjson.dumps(tmpl.get("variables", [])).decode(), now, now)
+        for tmpl in templates
+    ]
+    async with get_write_db() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        await db.executemany(
+            """INSERT INTO prompt_templates (id, name, content, category, is_builtin, variables, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 0, ?, ?, ?)""",
+            rows,
+        )
         await db.commit()
-    finally:
-        await db.close()
-    return {"imported": imported}
+    return {"imported": len(rows)}
@@ -1,33 +1,31 @@
-import uuid
+import asyncio
 from datetime import datetime, timezone
 
 from fastapi import APIRouter, HTTPException
 
-from database import get_db
+from database import get_read_db, get_write_db
 from models import WorkspaceCreate, WorkspaceUpdate, Workspace
 from services.vector_store import VectorStoreService
+from utils.ids import uuid7
+from utils.text_extraction import forget_extraction
 
 router = APIRouter()
 
 
 @router.get("/", response_model=list[Workspace])
 async def list_workspaces():
-    db = await get_db()
-    try:
+    async with get_read_db() as db:
         cursor = await db.execute(
             "SELECT * FROM workspaces ORDER BY updated_at DESC"
         )
         rows = await cursor.fetchall()
         return [dict(row) for row in rows]
-    finally:
-        await db.close()
 
 
 @router.post("/", response_model=Workspace)
 async def create_workspace(body: WorkspaceCreate):
-    db = await get_db()
-    try:
-        workspace_id = str(uuid.uuid4())
+    async with get_write_db() as db:
+        workspace_id = str(uuid7())
         now = datetime.now(timezone.utc).isoformat()
         await db.execute(
             "INSERT INTO workspaces (id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
@@ -40,35 +38,31 @@ async def create_workspace(body: WorkspaceCreate):
             "created_at": now,
             "updated_at": now,
         }
-    finally:
-        await db.close()
 
 
 @router.put("/{workspace_id}", response_model=Workspace)
 async def update_workspace(workspace_id: str, body: WorkspaceUpdate):
-    db = await get_db()
-    try:
+    async with get_write_db() as db:
         now = datetime.now(timezone.utc).isoformat()
-        result = await db.execute(
-            "UPDATE workspaces SET name = ?, updated_at = ? WHERE id = ?",
+        cursor = await db.execute(
+            "UPDATE workspaces SET name = ?, updated_at = ? WHERE id = ? RETURNING *",
             (body.name, now, workspace_id),
         )
-        if result.rowcount == 0:
+        row = await cursor.fetchone()
+        if not row:
             raise HTTPException(status_code=404, detail="Workspace not found")
         await db.commit()
-        cursor = await db.execute(
-            "SELECT * FROM workspaces WHERE id = ?", (workspace_id,)
-        )
-        row = await cursor.fetchone()
         return dict(row)
-    finally:
-        await db.close()
 
 
 @router.delete("/{workspace_id}")
 async def delete_workspace(workspace_id: str):
-    db = await get_db()
-    try:
+    async with get_write_db() as db:
+        # Documents go with the workspace via ON DELETE CASCADE.
+        cursor = await db.execute(
+            "SELECT file_path FROM documents WHERE workspace_id = ?", (workspace_id,)
+        )
+        file_paths = [row["file_path"] for row in await cursor.fetchall()]
         result = await db.execute(
             "DELETE FROM workspaces WHERE id = ?", (workspace_id,)
         )
@@ -76,12 +70,16 @@ async def delete_workspace(workspace_id: str):
             raise HTTPException(status_code=404, detail="Workspace not found")
         await db.commit()
 
+    try:
+        vs = VectorStoreService()
+        await asyncio.to_thread(vs.delete_collection, workspace_id)
+    except Exception:
+        pass
+
+    for file_path in file_paths:
         try:
-            vs = VectorStoreService()
-            vs.delete_collection(workspace_id)
-        except Exception:
+            forget_extraction(file_path)
+        except OSError:
             pass
 
-        return {"deleted": True}
-    finally:
-        await db.close()
+    return {"deleted": True}
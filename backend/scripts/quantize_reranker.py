@@ -0,0 +1,63 @@
+"""
+Export the re-ranking cross-encoder to ONNX and quantize it to int8.
+
+The int8 model runs on ONNX Runtime's CPU provider, which uses VNNI/AVX-512
+int8 kernels where available, at a quarter of the FP32 weight size.
+
+Usage (from backend/, with torch, transformers and onnxruntime installed):
+    python scripts/quantize_reranker.py ~/.local-ai-workspace/models/reranker.int8.onnx
+
+Then point LAW_RERANKER_ONNX_PATH at the output file.
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+DEFAULT_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def export_onnx(model_name: str, output: Path):
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["query"], ["document"], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            str(output),
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", type=Path, help="Path to write the int8 ONNX model to")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Hugging Face cross-encoder to export")
+    args = parser.parse_args()
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output = args.output.expanduser()
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = Path(tmp) / "model.onnx"
+        export_onnx(args.model, fp32_path)
+        quantize_dynamic(str(fp32_path), str(output), weight_type=QuantType.QInt8)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
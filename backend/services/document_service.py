@@ -1,20 +1,34 @@
+import asyncio
 import logging
 
 from services.ollama_service import OllamaService
 from services.vector_store import VectorStoreService
 from services.hybrid_search import HybridSearchService
+from services.query_cache import mark_workspace_changed
 from utils.text_extraction import extract_text
 from utils.chunking import chunk_text
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Chunks sent to the embedder per request while ingesting.
+EMBED_BATCH_SIZE = 32
+
+# Seconds to wait for more changes before rebuilding a workspace's BM25 index,
+# so a burst of uploads or deletions costs one rebuild.
+BM25_REBUILD_DELAY = 0.5
+
 
 class DocumentService:
     def __init__(self):
         self.ollama = OllamaService()
         self.vector_store = VectorStoreService()
-        self.hybrid_search = HybridSearchService()
+        self.hybrid_search = HybridSearchService(index_dir=settings.data_dir / "bm25")
+        # Chroma and BM25 work runs in worker threads; writes to one
+        # workspace are serialized so they don't contend with each other.
+        self._workspace_locks: dict[str, asyncio.Lock] = {}
+        self._rebuild_tasks: dict[str, asyncio.Task] = {}
+        self._rebuild_pending: set[str] = set()
 
     async def ingest(
         self,
@@ -43,48 +57,109 @@ class DocumentService:
         """
         logger.info("Ingesting %s for workspace %s", filename, workspace_id)
 
-        pages = extract_text(file_path)
+        pages = await asyncio.to_thread(extract_text, file_path)
         if not pages:
             raise ValueError(f"No text could be extracted from {filename}")
 
         # Use configured chunking strategy if not specified
         strategy = chunking_strategy or settings.chunking_strategy
 
-        chunks = []
-        for page_num, page_text in pages:
-            page_chunks = chunk_text(page_text, chunk_size, chunk_overlap, strategy=strategy)
-            for chunk in page_chunks:
-                chunks.append({
-                    "text": chunk,
-                    "filename": filename,
-                    "page": page_num,
-                })
-
-        if not chunks:
+        # Chunk pages in a worker thread while earlier batches are embedded,
+        # so the embedder isn't idle during chunking and vice versa.
+        queue: asyncio.Queue[dict | None] = asyncio.Queue(maxsize=EMBED_BATCH_SIZE * 4)
+        count = 0
+
+        async def produce():
+            for page_num, page_text in pages:
+                page_chunks = await asyncio.to_thread(
+                    chunk_text, page_text, chunk_size, chunk_overlap, strategy=strategy
+                )
+                for chunk in page_chunks:
+                    await queue.put({
+                        "text": chunk,
+                        "filename": filename,
+                        "page": page_num,
+                    })
+            await queue.put(None)
+
+        async def consume():
+            nonlocal count
+            batch = []
+            while (item := await queue.get()) is not None:
+                batch.append(item)
+                if len(batch) == EMBED_BATCH_SIZE:
+                    count += await self._store_batch(workspace_id, doc_id, batch, count)
+                    batch = []
+            if batch:
+                count += await self._store_batch(workspace_id, doc_id, batch, count)
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(produce())
+                tg.create_task(consume())
+        except BaseException as e:
+            # Don't leave a partially embedded document behind.
+            if count:
+                async with self._workspace_lock(workspace_id):
+                    await asyncio.to_thread(self.vector_store.delete_document, workspace_id, doc_id)
+                mark_workspace_changed(workspace_id)
+            if isinstance(e, ExceptionGroup):
+                raise e.exceptions[0] from None
+            raise
+
+        if not count:
             raise ValueError(f"No text chunks generated from {filename}")
 
-        logger.info("Generated %d chunks from %s using '%s' strategy", len(chunks), filename, strategy)
+        logger.info("Ingestion complete: %d chunks stored for %s using '%s' strategy", count, filename, strategy)
 
-        texts = [c["text"] for c in chunks]
-        embeddings = await self.ollama.embed_batch(texts)
+        self._schedule_bm25_rebuild(workspace_id)
 
-        count = self.vector_store.add_chunks(workspace_id, doc_id, chunks, embeddings)
-        logger.info("Ingestion complete: %d chunks stored for %s", count, filename)
+        return count
 
-        # Rebuild BM25 index for this workspace
-        await self._rebuild_bm25_index(workspace_id)
+    async def _store_batch(self, workspace_id: str, doc_id: str, chunks: list[dict], start_index: int) -> int:
+        embeddings = await self.ollama.embed_batch([c["text"] for c in chunks])
+        async with self._workspace_lock(workspace_id):
+            stored = await asyncio.to_thread(
+                self.vector_store.add_chunks, workspace_id, doc_id, chunks, embeddings, start_index
+            )
+        mark_workspace_changed(workspace_id)
+        return stored
 
-        return count
+    def _workspace_lock(self, workspace_id: str) -> asyncio.Lock:
+        return self._workspace_locks.setdefault(workspace_id, asyncio.Lock())
 
     async def remove_document(self, workspace_id: str, doc_id: str):
-        """Remove a document from a workspace and rebuild BM25 index."""
-        self.vector_store.delete_document(workspace_id, doc_id)
-
-        # Rebuild BM25 index
-        await self._rebuild_bm25_index(workspace_id)
+        """Remove a document from a workspace and schedule a BM25 index rebuild."""
+        async with self._workspace_lock(workspace_id):
+            await asyncio.to_thread(self.vector_store.delete_document, workspace_id, doc_id)
+        mark_workspace_changed(workspace_id)
+
+        self._schedule_bm25_rebuild(workspace_id)
+
+    def _schedule_bm25_rebuild(self, workspace_id: str):
+        """Rebuild the workspace's BM25 index once the current burst of changes settles."""
+        self._rebuild_pending.add(workspace_id)
+        task = self._rebuild_tasks.get(workspace_id)
+        if task is None or task.done():
+            self._rebuild_tasks[workspace_id] = asyncio.create_task(
+                self._debounced_rebuild(workspace_id)
+            )
+
+    async def _debounced_rebuild(self, workspace_id: str):
+        # Changes that land while a rebuild runs mark the workspace pending
+        # again, so the loop picks them up with one more pass.
+        while workspace_id in self._rebuild_pending:
+            await asyncio.sleep(BM25_REBUILD_DELAY)
+            self._rebuild_pending.discard(workspace_id)
+            await self._rebuild_bm25_index(workspace_id)
 
     async def _rebuild_bm25_index(self, workspace_id: str):
         """Rebuild the BM25 index for a workspace from all stored chunks."""
+        async with self._workspace_lock(workspace_id):
+            await asyncio.to_thread(self._rebuild_bm25_index_sync, workspace_id)
+        mark_workspace_changed(workspace_id)
+
+    def _rebuild_bm25_index_sync(self, workspace_id: str):
         try:
             # Get all chunks for this workspace
             collection = self.vector_store.get_or_create_collection(workspace_id)
@@ -8,39 +8,202 @@ Includes:
 - Recursive retrieval
 """
 
+import asyncio
+import copy
+import hashlib
+import heapq
 import logging
+import os
+import pickle
+import re
+import sys
+from collections import Counter, defaultdict
+from operator import itemgetter
+from pathlib import Path
 from typing import Literal
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+# Word characters in any script; punctuation no longer sticks to tokens.
+_TOKEN_RE = re.compile(r"\w+")
+
+# Lightweight cross-encoder used for re-ranking.
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Query/chunk pairs scored per cross-encoder forward pass.
+RERANK_BATCH_SIZE = 32
+
+# Chunks are short, so capping the sequence length bounds per-pair compute.
+RERANK_MAX_LENGTH = 256
+
+# Reciprocal Rank Fusion damping constant; 60 is the value from the original
+# RRF paper and keeps low-ranked results from being ignored entirely.
+RRF_K = 60
+
+# Bumped whenever tokenization or the index format changes so persisted
+# indices get rebuilt.
+_INDEX_VERSION = b"4"
+
+# In-memory BM25 indices per index directory, shared by every
+# HybridSearchService persisting there.
+_shared_indices: dict[Path, dict[str, dict]] = {}
+
+
+class SparseBM25:
+    """
+    Okapi BM25 over flat, term-sorted posting arrays.
+
+    Scores match rank_bm25.BM25Okapi (including its epsilon floor for
+    negative idf), but term weights are precomputed and a query term only
+    touches the documents that contain it, in one vectorized update.
+
+    Postings for every term live in parallel arrays (document id, raw term
+    frequency, weight) grouped by term id, with offsets[t]:offsets[t + 1]
+    spanning term t. Keeping the raw frequencies lets extend() add documents
+    without re-tokenizing the existing ones: only the new documents are
+    counted in Python, and the weights, which depend on corpus size and
+    average length, are recomputed for the whole corpus in NumPy.
+    """
+
+    def __init__(self, corpus: list[list[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.corpus_size = 0
+        self.vocab: dict[str, int] = {}
+        self.doc_len = np.zeros(0, dtype=np.float64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.tf = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float64)
+        self.extend(corpus)
+
+    def extend(self, corpus: list[list[str]]):
+        """
+        Append documents, numbered after the existing ones.
+
+        Arrays and the vocabulary are replaced rather than modified, so a
+        shallow copy of an index can be extended while the original keeps
+        serving searches.
+        """
+        # Unique terms of each new document, flattened, with their counts.
+        terms: list[str] = []
+        freqs: list[int] = []
+        unique_counts: list[int] = []
+        for doc in corpus:
+            counts = Counter(doc)
+            terms.extend(counts)
+            freqs.extend(counts.values())
+            unique_counts.append(len(counts))
+
+        # Unseen terms get the next free id; mapping through a defaultdict
+        # keeps the per-term work out of the Python interpreter loop.
+        vocab = defaultdict(None, self.vocab)
+        vocab.default_factory = vocab.__len__
+        new_terms = np.fromiter(map(vocab.__getitem__, terms), dtype=np.int64, count=len(terms))
+        new_docs = np.repeat(np.arange(self.corpus_size, self.corpus_size + len(corpus)), unique_counts)
+
+        # Expand the existing postings back to one term id per entry, append
+        # the new ones and regroup by term. The sort is stable, so document
+        # ids stay ascending within each term.
+        old_terms = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        all_terms = np.concatenate([old_terms, new_terms])
+        order = np.argsort(all_terms, kind="stable")
+        all_terms = all_terms[order]
+        self.doc_ids = np.concatenate([self.doc_ids, new_docs])[order]
+        self.tf = np.concatenate([self.tf, np.array(freqs, dtype=np.int32)])[order]
+
+        df = np.bincount(all_terms, minlength=len(vocab))
+        self.offsets = np.concatenate([[0], np.cumsum(df)])
+        self.doc_len = np.concatenate([
+            self.doc_len,
+            np.fromiter((len(doc) for doc in corpus), dtype=np.float64, count=len(corpus)),
+        ])
+        self.corpus_size += len(corpus)
+        self.vocab = dict(vocab)
+        self.weights = self._weights(all_terms, df)
+
+    def _weights(self, terms: np.ndarray, df: np.ndarray) -> np.ndarray:
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        if idf.size:
+            idf[idf < 0] = self.epsilon * idf.mean()
+        avgdl = self.doc_len.mean() if self.corpus_size and self.doc_len.any() else 1.0
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_len / avgdl)
+        tf = self.tf.astype(np.float64)
+        return idf[terms] * (tf * (self.k1 + 1) / (tf + length_norm[self.doc_ids]))
+
+    def get_scores(self, query: list[str]) -> np.ndarray:
+        scores = np.zeros(self.corpus_size)
+        for term in query:
+            term_id = self.vocab.get(term)
+            if term_id is not None:
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
 
 class HybridSearchService:
     """Service for advanced retrieval with hybrid search and re-ranking."""
 
-    def __init__(self):
-        self.bm25_indices = {}  # workspace_id -> BM25 index
+    def __init__(self, index_dir: Path | None = None, reranker_onnx_path: Path | None = None):
+        """
+        Args:
+            index_dir: Directory to persist BM25 indices in. When set, indices
+                survive restarts and are shared between service instances;
+                when None they live in memory only.
+            reranker_onnx_path: Int8-quantized ONNX export of the cross-encoder
+                (see scripts/quantize_reranker.py), used for CPU re-ranking
+                when onnxruntime is installed.
+        """
+        # workspace_id -> BM25 index. Instances persisting to the same
+        # directory share one dict, so a process holds each index only once.
+        if index_dir is None:
+            self.bm25_indices = {}
+        else:
+            self.bm25_indices = _shared_indices.setdefault(index_dir.resolve(), {})
         self.reranker = None  # Lazy-loaded cross-encoder
+        self.index_dir = index_dir
+        self.reranker_onnx_path = reranker_onnx_path.expanduser() if reranker_onnx_path else None
 
     def index_documents_for_bm25(self, workspace_id: str, documents: list[str]):
         """
         Build BM25 index for a workspace.
 
+        Skips the build when the documents are unchanged since the index in
+        memory (or on disk) was built, and only tokenizes the new documents
+        when the list extends the indexed one (chunks appended by an upload).
+
         Args:
             workspace_id: Workspace identifier
             documents: List of document texts to index
         """
-        from rank_bm25 import BM25Okapi
+        digest = _corpus_digest(documents)
+        current = self._current_index(workspace_id)
+        if current is not None and current.get("hash") == digest:
+            self.bm25_indices[workspace_id] = current
+            return
+
+        indexed = current["documents"] if current is not None else []
+        if indexed and len(documents) > len(indexed) and documents[:len(indexed)] == indexed:
+            # Extend a copy; searches may still be reading the current index.
+            index = copy.copy(current["index"])
+            index.extend([_tokenize(doc) for doc in documents[len(indexed):]])
+            action = f"Extended BM25 index by {len(documents) - len(indexed)} documents"
+        else:
+            index = SparseBM25([_tokenize(doc) for doc in documents])
+            action = "Built BM25 index"
 
-        # Tokenize documents (simple word split)
-        tokenized_docs = [doc.lower().split() for doc in documents]
-
-        # Create BM25 index
         self.bm25_indices[workspace_id] = {
-            "index": BM25Okapi(tokenized_docs),
+            "index": index,
             "documents": documents,
+            "hash": digest,
+            "version": _INDEX_VERSION,
         }
+        self._save_index(workspace_id)
 
-        logger.info(f"Built BM25 index for workspace {workspace_id} with {len(documents)} documents")
+        logger.info(f"{action} for workspace {workspace_id} with {len(documents)} documents")
 
     def search_bm25(
         self,
@@ -59,23 +222,25 @@ class HybridSearchService:
         Returns:
             List of search results with scores
         """
-        if workspace_id not in self.bm25_indices:
+        index_data = self._current_index(workspace_id)
+        if index_data is None:
             logger.warning(f"No BM25 index found for workspace {workspace_id}")
             return []
 
-        index_data = self.bm25_indices[workspace_id]
         bm25 = index_data["index"]
         documents = index_data["documents"]
 
-        # Tokenize query
-        tokenized_query = query.lower().split()
+        tokenized_query = _tokenize(query)
 
         # Get BM25 scores
         scores = bm25.get_scores(tokenized_query)
 
-        # Get top-k results
-        import numpy as np
-        top_indices = np.argsort(scores)[::-1][:top_k]
+        # Get top-k results: partition out the best k in O(n), then sort only those
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return []
+        top_indices = np.argpartition(scores, -k)[-k:]
+        top_indices = top_indices[np.argsort(scores[top_indices])[::-1]]
 
         results = []
         for idx in top_indices:
@@ -97,6 +262,7 @@ class HybridSearchService:
         top_k: int = 10,
         vector_weight: float = 0.7,
         bm25_weight: float = 0.3,
+        bm25_results: list[dict] | None = None,
     ) -> list[dict]:
         """
         Combine vector search and BM25 search results.
@@ -109,33 +275,26 @@ class HybridSearchService:
             top_k: Number of final results
             vector_weight: Weight for vector scores (0-1)
             bm25_weight: Weight for BM25 scores (0-1)
+            bm25_results: BM25 results if already fetched (top_k * 2 of them)
 
         Returns:
             Combined and re-ranked results
         """
-        # Get BM25 results
-        bm25_results = self.search_bm25(workspace_id, query, top_k=top_k * 2)
+        if bm25_results is None:
+            bm25_results = await asyncio.to_thread(self.search_bm25, workspace_id, query, top_k=top_k * 2)
 
         if not bm25_results:
             # Fall back to vector-only search
             return vector_results[:top_k]
 
-        # Normalize scores to 0-1 range
-        vector_results_normalized = self._normalize_scores(vector_results)
-        bm25_results_normalized = self._normalize_scores(bm25_results)
-
-        # Combine results
         combined = self._combine_results(
-            vector_results_normalized,
-            bm25_results_normalized,
+            vector_results,
+            bm25_results,
             vector_weight,
             bm25_weight,
         )
 
-        # Sort by combined score
-        combined.sort(key=lambda x: x["score"], reverse=True)
-
-        return combined[:top_k]
+        return heapq.nlargest(top_k, combined, key=itemgetter("score"))
 
     async def rerank_results(
         self,
@@ -163,10 +322,7 @@ class HybridSearchService:
         # Lazy-load the cross-encoder
         if self.reranker is None:
             try:
-                from sentence_transformers import CrossEncoder
-                # Use a lightweight cross-encoder model
-                self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-                logger.info("Loaded cross-encoder for re-ranking")
+                self.reranker = self._load_reranker()
             except Exception as e:
                 logger.warning(f"Failed to load cross-encoder: {e}")
                 return results[:top_k]
@@ -176,22 +332,51 @@ class HybridSearchService:
 
         try:
             # Get cross-encoder scores
-            scores = self.reranker.predict(pairs)
+            scores = self.reranker.predict(
+                pairs,
+                batch_size=RERANK_BATCH_SIZE,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
 
             # Update results with new scores
             for i, result in enumerate(results):
                 result["rerank_score"] = float(scores[i])
                 result["original_score"] = result.get("score", 0.0)
 
-            # Sort by rerank score
-            results.sort(key=lambda x: x["rerank_score"], reverse=True)
-
-            return results[:top_k]
+            return heapq.nlargest(top_k, results, key=itemgetter("rerank_score"))
 
         except Exception as e:
             logger.error(f"Re-ranking failed: {e}")
             return results[:top_k]
 
+    def _load_reranker(self):
+        """Load the fastest available cross-encoder backend."""
+        import torch
+
+        if torch.cuda.is_available():
+            from sentence_transformers import CrossEncoder
+
+            reranker = CrossEncoder(RERANKER_MODEL, device="cuda", max_length=RERANK_MAX_LENGTH)
+            # FP16 halves weight bandwidth and runs on tensor cores
+            reranker.model.half()
+            logger.info("Loaded cross-encoder for re-ranking on cuda (fp16)")
+            return reranker
+
+        if self.reranker_onnx_path is not None and self.reranker_onnx_path.exists():
+            try:
+                reranker = _OnnxCrossEncoder(self.reranker_onnx_path)
+                logger.info(f"Loaded int8 ONNX cross-encoder from {self.reranker_onnx_path}")
+                return reranker
+            except Exception as e:
+                logger.warning(f"Falling back to the PyTorch cross-encoder: {e}")
+
+        from sentence_transformers import CrossEncoder
+
+        reranker = CrossEncoder(RERANKER_MODEL, device="cpu", max_length=RERANK_MAX_LENGTH)
+        logger.info("Loaded cross-encoder for re-ranking on cpu")
+        return reranker
+
     async def recursive_retrieval(
         self,
         workspace_id: str,
@@ -245,12 +430,9 @@ class HybridSearchService:
         if not results:
             return []
 
-        scores = [r.get("score", 0) for r in results]
-        if not scores:
-            return results
-
-        min_score = min(scores)
-        max_score = max(scores)
+        scores = np.fromiter((r.get("score", 0) for r in results), dtype=np.float64, count=len(results))
+        min_score = scores.min()
+        max_score = scores.max()
 
         if max_score == min_score:
             # All scores are the same
@@ -258,9 +440,9 @@ class HybridSearchService:
                 r["score"] = 1.0
             return results
 
-        for r in results:
-            original_score = r.get("score", 0)
-            r["score"] = (original_score - min_score) / (max_score - min_score)
+        normalized = ((scores - min_score) / (max_score - min_score)).tolist()
+        for r, score in zip(results, normalized):
+            r["score"] = score
 
         return results
 
@@ -272,47 +454,186 @@ class HybridSearchService:
         bm25_weight: float,
     ) -> list[dict]:
         """
-        Combine vector and BM25 results using weighted scoring.
+        Combine vector and BM25 results using weighted Reciprocal Rank Fusion.
 
-        Uses Reciprocal Rank Fusion (RRF) with score weighting.
+        Each list contributes weight / (RRF_K + rank) per result, so raw scores
+        only matter for ordering within their own list. The fused score is
+        scaled so a result ranked first in both lists scores 1.0.
         """
-        # Create a map of chunk_text -> combined score
+        # Create a map of chunk_text -> combined result. Results are updated
+        # in place rather than copied; callers don't reuse the inputs.
         combined_map = {}
+        scale = (RRF_K + 1) / (vector_weight + bm25_weight)
 
-        for result in vector_results:
-            text = result["chunk_text"]
-            score = result.get("score", 0) * vector_weight
-            combined_map[text] = {
-                **result,
-                "score": score,
-                "vector_score": result.get("score", 0),
-            }
-
-        for result in bm25_results:
+        vector_rrf = self._rrf_contributions(vector_results, vector_weight * scale)
+        for result, contribution in zip(vector_results, vector_rrf):
+            result["vector_score"] = result.get("score", 0)
+            result["bm25_score"] = 0.0
+            result["score"] = contribution
+            combined_map[result["chunk_text"]] = result
+
+        bm25_rrf = self._rrf_contributions(bm25_results, bm25_weight * scale)
+        for result, contribution in zip(bm25_results, bm25_rrf):
             text = result["chunk_text"]
-            bm25_score = result.get("score", 0) * bm25_weight
+            existing = combined_map.get(text)
 
-            if text in combined_map:
+            if existing is not None:
                 # Already in vector results, boost score
-                combined_map[text]["score"] += bm25_score
-                combined_map[text]["bm25_score"] = result.get("score", 0)
+                existing["bm25_score"] = result.get("score", 0)
+                existing["score"] += contribution
             else:
                 # Only in BM25 results
-                combined_map[text] = {
-                    **result,
-                    "score": bm25_score,
-                    "bm25_score": result.get("score", 0),
-                    "vector_score": 0.0,
-                }
+                result["bm25_score"] = result.get("score", 0)
+                result["vector_score"] = 0.0
+                result["score"] = contribution
+                combined_map[text] = result
 
         return list(combined_map.values())
 
+    @staticmethod
+    def _rrf_contributions(results: list[dict], weight: float) -> list[float]:
+        """Return weight / (RRF_K + rank) for each result, ranked by descending score."""
+        if not results:
+            return []
+        scores = np.fromiter((r.get("score", 0) for r in results), dtype=np.float64, count=len(results))
+        ranks = np.empty(len(results), dtype=np.float64)
+        ranks[np.argsort(-scores, kind="stable")] = np.arange(1, len(results) + 1)
+        return (weight / (RRF_K + ranks)).tolist()
+
     def update_index(self, workspace_id: str, documents: list[str]):
         """Update BM25 index when documents are added/removed."""
         self.index_documents_for_bm25(workspace_id, documents)
 
     def delete_index(self, workspace_id: str):
         """Delete BM25 index for a workspace."""
+        if self.index_dir is not None:
+            self._index_path(workspace_id).unlink(missing_ok=True)
         if workspace_id in self.bm25_indices:
             del self.bm25_indices[workspace_id]
             logger.info(f"Deleted BM25 index for workspace {workspace_id}")
+
+    def _index_path(self, workspace_id: str) -> Path:
+        return self.index_dir / f"{workspace_id}.pkl"
+
+    def _current_index(self, workspace_id: str) -> dict | None:
+        """
+        Return the freshest index for a workspace.
+
+        Another service instance may have rebuilt the index on disk since it
+        was loaded here, so the file is stat'ed before each use.
+        """
+        cached = self.bm25_indices.get(workspace_id)
+        if self.index_dir is None:
+            return cached
+        try:
+            stamp = _file_stamp(self._index_path(workspace_id).stat())
+        except FileNotFoundError:
+            return cached if cached is not None and "stamp" not in cached else None
+        if cached is not None and cached.get("stamp") == stamp:
+            return cached
+        loaded = self._load_index(workspace_id)
+        if loaded is not None:
+            self.bm25_indices[workspace_id] = loaded
+        return loaded
+
+    def _load_index(self, workspace_id: str) -> dict | None:
+        if self.index_dir is None:
+            return None
+        path = self._index_path(workspace_id)
+        try:
+            with open(path, "rb") as f:
+                stamp = _file_stamp(os.fstat(f.fileno()))
+                index_data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable BM25 index {path}: {e}")
+            return None
+        if index_data.get("version") != _INDEX_VERSION:
+            logger.warning(f"Ignoring BM25 index {path} in an old format; it is rebuilt on the next change")
+            return None
+        index_data["stamp"] = stamp
+        return index_data
+
+    def _save_index(self, workspace_id: str):
+        if self.index_dir is None:
+            return
+        index_data = self.bm25_indices[workspace_id]
+        path = self._index_path(workspace_id)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(
+                    {k: v for k, v in index_data.items() if k != "stamp"},
+                    f,
+                    protocol=5,
+                )
+            # Atomic swap so readers never see a half-written index.
+            os.replace(tmp_path, path)
+            index_data["stamp"] = _file_stamp(path.stat())
+        except Exception as e:
+            logger.warning(f"Failed to persist BM25 index for workspace {workspace_id}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+
+class _OnnxCrossEncoder:
+    """Int8 ONNX Runtime stand-in for CrossEncoder.predict on CPU."""
+
+    def __init__(self, model_path: Path):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(RERANKER_MODEL)
+
+    def predict(self, pairs: list[list[str]], batch_size: int = RERANK_BATCH_SIZE, **_) -> np.ndarray:
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            encoded = self.tokenizer(
+                [q for q, _ in batch],
+                [d for _, d in batch],
+                padding=True,
+                truncation=True,
+                max_length=RERANK_MAX_LENGTH,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+            logits = self.session.run(None, feeds)[0]
+            scores.append(logits[:, 0])
+        # Same sigmoid CrossEncoder applies to single-label models
+        return 1.0 / (1.0 + np.exp(-np.concatenate(scores)))
+
+
+def _file_stamp(st: os.stat_result) -> tuple[int, int, int]:
+    # Every save writes a new file, so the inode and size change even when two
+    # rebuilds land within the same mtime tick.
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _tokenize(text: str) -> list[str]:
+    """
+    Split text into lowercase word tokens.
+
+    Tokens are interned so the repeated terms BM25 counts share one string
+    object and compare by identity.
+    """
+    return [sys.intern(token) for token in _TOKEN_RE.findall(text.lower())]
+
+
+def _corpus_digest(documents: list[str]) -> bytes:
+    """Fingerprint a document list so unchanged corpora skip a rebuild."""
+    h = hashlib.blake2b(_INDEX_VERSION, digest_size=16)
+    for doc in documents:
+        data = doc.encode()
+        # Length-prefix each document so ["ab", "c"] and ["a", "bc"] differ.
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.digest()
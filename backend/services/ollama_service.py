@@ -1,15 +1,61 @@
 import asyncio
-import json
 import logging
 from typing import AsyncGenerator
 
 import httpx
+import orjson
 
 from config import settings
 from models import OllamaStatus, OllamaModel
 
 logger = logging.getLogger(__name__)
 
+# Concurrent connections to Ollama, and how many of them stay open idle
+# between requests.
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+
+# Texts sent to /api/embed in a single request, bounding request size.
+EMBED_REQUEST_SIZE = 64
+
+# One client for every OllamaService so embed/chat calls reuse pooled
+# keep-alive connections instead of reconnecting each time.
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared Ollama HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=settings.ollama_base_url,
+            timeout=settings.api_timeout,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    """Close the shared Ollama HTTP client and its pooled connections."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+def _parse_chat_frame(line: bytes) -> tuple[str, bool]:
+    """Return (content, done) for one /api/chat NDJSON line; blank or bad lines yield nothing."""
+    if not line.strip():
+        return "", False
+    try:
+        data = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        return "", False
+    return data.get("message", {}).get("content", ""), bool(data.get("done"))
+
 
 class OllamaService:
     def __init__(self):
@@ -18,16 +64,11 @@ class OllamaService:
         self.max_retries = settings.retry_attempts
         self.backoff = settings.retry_backoff
 
-    async def _client(self) -> httpx.AsyncClient:
-        return httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
-
     async def _request_with_retry(self, method: str, path: str, **kwargs) -> httpx.Response:
         last_exc = None
         for attempt in range(self.max_retries):
             try:
-                async with await self._client() as client:
-                    resp = await getattr(client, method)(path, **kwargs)
-                    return resp
+                return await getattr(get_client(), method)(path, **kwargs)
             except (httpx.ConnectError, httpx.TimeoutException, httpx.ReadError) as e:
                 last_exc = e
                 wait = self.backoff * (2 ** attempt)
@@ -78,13 +119,12 @@ class OllamaService:
 
     async def pull_model(self, model_name: str) -> dict:
         try:
-            async with await self._client() as client:
-                resp = await client.post(
-                    "/api/pull",
-                    json={"name": model_name},
-                    timeout=600,
-                )
-                return {"success": resp.status_code == 200, "model": model_name}
+            resp = await get_client().post(
+                "/api/pull",
+                json={"name": model_name},
+                timeout=600,
+            )
+            return {"success": resp.status_code == 200, "model": model_name}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
@@ -97,37 +137,40 @@ class OllamaService:
         last_exc = None
         for attempt in range(self.max_retries):
             try:
-                async with await self._client() as client:
-                    async with client.stream(
-                        "POST",
-                        "/api/chat",
-                        json={
-                            "model": model,
-                            "messages": messages,
-                            "stream": True,
-                            "options": {"temperature": temperature},
-                        },
-                        timeout=self.timeout,
-                    ) as resp:
-                        if resp.status_code != 200:
-                            error_body = await resp.aread()
-                            raise RuntimeError(
-                                f"Ollama error ({resp.status_code}): {error_body.decode()}"
-                            )
-
-                        async for line in resp.aiter_lines():
-                            if not line.strip():
-                                continue
-                            try:
-                                data = json.loads(line)
-                                content = data.get("message", {}).get("content", "")
-                                if content:
-                                    yield content
-                                if data.get("done"):
-                                    return
-                            except json.JSONDecodeError:
-                                continue
-                        return
+                async with get_client().stream(
+                    "POST",
+                    "/api/chat",
+                    json={
+                        "model": model,
+                        "messages": messages,
+                        "stream": True,
+                        "options": {"temperature": temperature},
+                    },
+                    timeout=self.timeout,
+                ) as resp:
+                    if resp.status_code != 200:
+                        error_body = await resp.aread()
+                        raise RuntimeError(
+                            f"Ollama error ({resp.status_code}): {error_body.decode()}"
+                        )
+
+                    # Split NDJSON frames on raw bytes; orjson parses bytes
+                    # directly, so lines never get decoded to str.
+                    buffer = bytearray()
+                    async for chunk in resp.aiter_bytes():
+                        buffer += chunk
+                        *lines, rest = buffer.split(b"\n")
+                        buffer = bytearray(rest)
+                        for line in lines:
+                            content, done = _parse_chat_frame(line)
+                            if content:
+                                yield content
+                            if done:
+                                return
+                    content, _ = _parse_chat_frame(buffer)
+                    if content:
+                        yield content
+                    return
             except RuntimeError:
                 raise
             except (httpx.ConnectError, httpx.TimeoutException, httpx.ReadError) as e:
@@ -145,25 +188,38 @@ class OllamaService:
         )
 
     async def embed(self, text: str, model: str | None = None) -> list[float]:
+        embeddings = await self._embed_request(text, model or settings.default_embedding_model)
+        return embeddings[0]
+
+    async def embed_batch(self, texts: list[str], model: str | None = None) -> list[list[float]]:
+        """Embed many texts with one /api/embed request per EMBED_REQUEST_SIZE texts."""
+        if not texts:
+            return []
         model = model or settings.default_embedding_model
+        batches = await asyncio.gather(*(
+            self._embed_request(texts[i:i + EMBED_REQUEST_SIZE], model)
+            for i in range(0, len(texts), EMBED_REQUEST_SIZE)
+        ))
+        results = [emb for batch in batches for emb in batch]
+        if len(results) != len(texts):
+            raise RuntimeError(
+                f"Ollama returned {len(results)} embeddings for {len(texts)} inputs"
+            )
+        return results
+
+    async def _embed_request(self, inputs: str | list[str], model: str) -> list[list[float]]:
         resp = await self._request_with_retry(
             "post",
             "/api/embed",
-            json={"model": model, "input": text},
+            json={"model": model, "input": inputs},
             timeout=60,
         )
         if resp.status_code != 200:
             raise RuntimeError(f"Embedding failed: {resp.text}")
-        data = resp.json()
+        # orjson builds the float lists straight from the bytes, well ahead
+        # of the stdlib parser behind resp.json() on large batches.
+        data = orjson.loads(resp.content)
         embeddings = data.get("embeddings", [])
         if not embeddings:
             raise RuntimeError("No embeddings returned from Ollama")
-        return embeddings[0]
-
-    async def embed_batch(self, texts: list[str], model: str | None = None) -> list[list[float]]:
-        model = model or settings.default_embedding_model
-        results = []
-        for text in texts:
-            emb = await self.embed(text, model)
-            results.append(emb)
-        return results
+        return embeddings
@@ -0,0 +1,172 @@
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+# Inserts between sweeps that trim an EmbeddingStore back to max_entries.
+EVICT_EVERY = 256
+
+# Bumped whenever a workspace's chunks or BM25 index change, so cached
+# results from before the change stop matching.
+_generations: defaultdict[str, int] = defaultdict(int)
+
+
+def mark_workspace_changed(workspace_id: str):
+    """Invalidate cached search results for a workspace."""
+    _generations[workspace_id] += 1
+
+
+def workspace_generation(workspace_id: str) -> int:
+    return _generations[workspace_id]
+
+
+class SemanticQueryCache:
+    """
+    Search results keyed by query embedding.
+
+    A lookup returns the results of an earlier query in the same scope whose
+    embedding has cosine similarity >= threshold, so rephrasings of a recent
+    question skip retrieval entirely. Entries live in a fixed-size ring and
+    the oldest is overwritten first. At this size an exact matrix-vector scan
+    is cheap, so no approximate index is needed.
+    """
+
+    def __init__(self, max_entries: int = 4096, threshold: float = 0.97):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._vectors: np.ndarray | None = None
+        self._scopes = np.zeros(max_entries, dtype=np.int64)
+        self._results: list[list[dict] | None] = [None] * max_entries
+        self._size = 0
+        self._next = 0
+
+    def get(self, scope: tuple, embedding: list[float]) -> list[dict] | None:
+        """
+        Return copies of the cached results for a similar query in scope.
+
+        Args:
+            scope: Everything besides the query the results depend on
+            embedding: Query embedding
+
+        Returns:
+            Cached results, or None on a miss
+        """
+        query = self._unit(embedding)
+        if query is None or not self._size or self._vectors.shape[1] != query.shape[0]:
+            return None
+
+        sims = self._vectors[:self._size] @ query
+        sims[self._scopes[:self._size] != hash(scope)] = -np.inf
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return [dict(r) for r in self._results[best]]
+
+    def put(self, scope: tuple, embedding: list[float], results: list[dict]):
+        """Cache the results for a query, evicting the oldest entry when full."""
+        vector = self._unit(embedding)
+        if vector is None:
+            return
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            # First entry, or the embedding model changed dimension.
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._results = [None] * self.max_entries
+            self._size = self._next = 0
+
+        slot = self._next
+        self._vectors[slot] = vector
+        self._scopes[slot] = hash(scope)
+        self._results[slot] = [dict(r) for r in results]
+        self._next = (slot + 1) % self.max_entries
+        self._size = max(self._size, slot + 1)
+
+    @staticmethod
+    def _unit(embedding: list[float]) -> np.ndarray | None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if vector.ndim != 1 or not norm:
+            return None
+        return vector / norm
+
+
+class EmbeddingStore:
+    """
+    Query embeddings persisted in a small SQLite file, so they survive restarts.
+
+    Vectors are stored as float32 without further rounding, so a query sends
+    Chroma and the result cache the same vector before and after a restart.
+    Rows untouched for longest are evicted once the store holds more than
+    max_entries.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: sqlite3.Connection | None = None
+        # One connection shared by worker threads; sqlite3 needs calls on it
+        # serialized.
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, model: str, digest: bytes) -> list[float] | None:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT vec FROM query_embeddings WHERE model = ? AND digest = ?",
+                (model, digest),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE query_embeddings SET accessed_at = ? WHERE model = ? AND digest = ?",
+                (time.time(), model, digest),
+            )
+            conn.commit()
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def put(self, model: str, digest: bytes, embedding: list[float]):
+        vec = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, digest, vec, accessed_at) VALUES (?, ?, ?, ?)",
+                (model, digest, vec, time.time()),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                conn.execute(
+                    """DELETE FROM query_embeddings WHERE accessed_at < (
+                           SELECT accessed_at FROM query_embeddings
+                           ORDER BY accessed_at DESC LIMIT 1 OFFSET ?)""",
+                    (self.max_entries - 1,),
+                )
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.executescript(
+                """PRAGMA journal_mode=WAL;
+                   PRAGMA synchronous=NORMAL;
+                   CREATE TABLE IF NOT EXISTS query_embeddings (
+                       model TEXT NOT NULL,
+                       digest BLOB NOT NULL,
+                       vec BLOB NOT NULL,
+                       accessed_at REAL NOT NULL,
+                       PRIMARY KEY (model, digest)
+                   ) WITHOUT ROWID;
+                   CREATE INDEX IF NOT EXISTS idx_query_embeddings_accessed
+                       ON query_embeddings(accessed_at);"""
+            )
+            self._conn = conn
+        return self._conn
@@ -1,19 +1,41 @@
+import asyncio
+import hashlib
 import logging
+from collections import OrderedDict
 from typing import Literal
 
+import numpy as np
+
 from config import settings
 from services.ollama_service import OllamaService
 from services.vector_store import VectorStoreService
 from services.hybrid_search import HybridSearchService
+from services.query_cache import EmbeddingStore, SemanticQueryCache, workspace_generation
 
 logger = logging.getLogger(__name__)
 
+# Query embeddings kept in memory; conversations often repeat a query.
+# More are kept on disk by EmbeddingStore.
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+# Score cut-offs between the confidence labels, lowest first.
+CONFIDENCE_THRESHOLDS = (0.5, 0.8)
+CONFIDENCE_LABELS = ("low", "medium", "high")
+
 
 class RAGService:
     def __init__(self):
         self.ollama = OllamaService()
         self.vector_store = VectorStoreService()
-        self.hybrid_search = HybridSearchService()
+        self.hybrid_search = HybridSearchService(
+            index_dir=settings.data_dir / "bm25",
+            reranker_onnx_path=settings.reranker_onnx_path,
+        )
+        # (model, query digest) -> embedding, least recently used first.
+        self._embedding_cache: OrderedDict[tuple[str, bytes], list[float]] = OrderedDict()
+        self._results_cache = SemanticQueryCache()
+        # Backs the in-memory cache across restarts.
+        self._embedding_store = EmbeddingStore(settings.data_dir / "emb_cache.sqlite")
 
     async def search(
         self,
@@ -43,27 +65,46 @@ class RAGService:
         k = top_k or settings.top_k
 
         try:
-            query_embedding = await self.ollama.embed(query)
+            query_embedding = await self._embed_query(query)
         except Exception as e:
             logger.error("Failed to embed query: %s", e)
             return []
 
-        # Get vector search results
-        vector_results = self.vector_store.query(workspace_id, query_embedding, top_k=k * 2)
-
-        if strategy == "vector":
-            results = vector_results[:k]
-
-        elif strategy == "bm25":
-            results = self.hybrid_search.search_bm25(workspace_id, query, top_k=k)
+        # Near-identical queries against an unchanged workspace reuse results.
+        # Only vector results depend on the embedding alone; BM25 and the
+        # reranker score the query's exact terms, so those are never reused
+        # for a merely similar query.
+        use_cache = strategy == "vector"
+        scope = (
+            workspace_id,
+            workspace_generation(workspace_id),
+            settings.default_embedding_model,
+            strategy,
+            k,
+            use_recursive,
+        )
+        if use_cache:
+            cached = self._results_cache.get(scope, query_embedding)
+            if cached is not None:
+                return cached
+
+        if strategy == "bm25":
+            results = await asyncio.to_thread(self.hybrid_search.search_bm25, workspace_id, query, top_k=k)
 
         elif strategy == "hybrid" or strategy == "hybrid_rerank":
+            fused_k = k * 2 if strategy == "hybrid_rerank" else k
+            # Chroma and BM25 are independent; query them side by side.
+            vector_results, bm25_results = await asyncio.gather(
+                asyncio.to_thread(self.vector_store.query, workspace_id, query_embedding, top_k=k * 2),
+                asyncio.to_thread(self.hybrid_search.search_bm25, workspace_id, query, top_k=fused_k * 2),
+            )
             results = await self.hybrid_search.hybrid_search(
                 workspace_id=workspace_id,
                 query=query,
                 query_embedding=query_embedding,
                 vector_results=vector_results,
-                top_k=k * 2 if strategy == "hybrid_rerank" else k,
+                top_k=fused_k,
+                bm25_results=bm25_results,
             )
 
             if strategy == "hybrid_rerank":
@@ -71,7 +112,11 @@ class RAGService:
                 results = await self.hybrid_search.rerank_results(query, results, top_k=k)
 
         else:
-            results = vector_results[:k]
+            # "vector" and unknown strategies; only fusion needs the extra
+            # candidates, so don't pull 2k chunk texts to keep k of them.
+            results = await asyncio.to_thread(
+                self.vector_store.query, workspace_id, query_embedding, top_k=k
+            )
 
         # Apply recursive retrieval if enabled
         if use_recursive:
@@ -85,22 +130,51 @@ class RAGService:
                 logger.info(f"Recursive retrieval used {iterations} iterations")
 
         # Add confidence indicator
-        for result in results:
-            result["confidence"] = self._calculate_confidence(result)
+        self._assign_confidence(results)
 
+        if use_cache:
+            self._results_cache.put(scope, query_embedding, results)
         return results
 
-    def _calculate_confidence(self, result: dict) -> str:
-        """
-        Calculate confidence level based on score.
+    async def _embed_query(self, query: str) -> list[float]:
+        """Embed a query, reusing the embedding of an earlier identical query."""
+        model = settings.default_embedding_model
+        digest = hashlib.blake2b(query.encode(), digest_size=16).digest()
+        key = (model, digest)
+        cached = self._embedding_cache.get(key)
+        if cached is not None:
+            self._embedding_cache.move_to_end(key)
+            return cached
 
-        Returns: "high", "medium", or "low"
+        try:
+            embedding = await asyncio.to_thread(self._embedding_store.get, model, digest)
+        except Exception as e:
+            logger.warning("Query embedding store lookup failed: %s", e)
+            embedding = None
+
+        if embedding is None:
+            # Rounded to float32 like the stored copy, so this query's vector
+            # is identical whether it was just embedded or read back later.
+            embedding = np.asarray(await self.ollama.embed(query), dtype=np.float32).tolist()
+            try:
+                await asyncio.to_thread(self._embedding_store.put, model, digest, embedding)
+            except Exception as e:
+                logger.warning("Failed to persist query embedding: %s", e)
+
+        self._embedding_cache[key] = embedding
+        if len(self._embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            self._embedding_cache.popitem(last=False)
+        return embedding
+
+    def _assign_confidence(self, results: list[dict]):
         """
-        score = result.get("score", 0)
+        Label each result's confidence from its score, in place.
 
-        if score >= 0.8:
-            return "high"
-        elif score >= 0.5:
-            return "medium"
-        else:
-            return "low"
+        Scores >= 0.8 are "high", >= 0.5 "medium", anything lower "low".
+        """
+        if not results:
+            return
+        scores = np.fromiter((r.get("score", 0) for r in results), dtype=np.float64, count=len(results))
+        levels = np.digitize(scores, CONFIDENCE_THRESHOLDS).tolist()
+        for result, level in zip(results, levels):
+            result["confidence"] = CONFIDENCE_LABELS[level]
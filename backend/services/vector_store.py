@@ -1,6 +1,8 @@
 import logging
 
 import chromadb
+import numpy as np
+from chromadb import Collection
 from chromadb.config import Settings as ChromaSettings
 
 from config import settings
@@ -16,17 +18,23 @@ class VectorStoreService:
             path=str(chroma_dir),
             settings=ChromaSettings(anonymized_telemetry=False),
         )
+        # workspace_id -> collection handle, so hot paths skip Chroma's
+        # metadata lookup after the first call.
+        self._collections: dict[str, Collection] = {}
 
     def _collection_name(self, workspace_id: str) -> str:
         safe = workspace_id.replace("-", "_")[:60]
         return f"ws_{safe}"
 
-    def get_or_create_collection(self, workspace_id: str):
-        name = self._collection_name(workspace_id)
-        return self.client.get_or_create_collection(
-            name=name,
-            metadata={"hnsw:space": "cosine"},
-        )
+    def get_or_create_collection(self, workspace_id: str) -> Collection:
+        collection = self._collections.get(workspace_id)
+        if collection is None:
+            collection = self.client.get_or_create_collection(
+                name=self._collection_name(workspace_id),
+                metadata={"hnsw:space": "cosine"},
+            )
+            self._collections[workspace_id] = collection
+        return collection
 
     def add_chunks(
         self,
@@ -34,9 +42,11 @@ class VectorStoreService:
         doc_id: str,
         chunks: list[dict],
         embeddings: list[list[float]],
+        start_index: int = 0,
     ) -> int:
+        """Store chunks numbered from start_index, so a document can be added in batches."""
         collection = self.get_or_create_collection(workspace_id)
-        ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
+        ids = [f"{doc_id}_chunk_{i}" for i in range(start_index, start_index + len(chunks))]
         documents = [c["text"] for c in chunks]
         metadatas = [
             {
@@ -45,16 +55,21 @@ class VectorStoreService:
                 "page": c.get("page", 0),
                 "chunk_index": i,
             }
-            for i, c in enumerate(chunks)
+            for i, c in enumerate(chunks, start_index)
         ]
+        # One contiguous array instead of nested float lists Chroma would
+        # otherwise validate and convert element by element.
+        vectors = np.asarray(embeddings, dtype=np.float32)
 
-        batch_size = 100
+        # Ingestion batches are far below Chroma's limit, so this is
+        # normally a single add.
+        batch_size = self.client.get_max_batch_size()
         for start in range(0, len(ids), batch_size):
             end = start + batch_size
             collection.add(
                 ids=ids[start:end],
                 documents=documents[start:end],
-                embeddings=embeddings[start:end],
+                embeddings=vectors[start:end],
                 metadatas=metadatas[start:end],
             )
 
@@ -78,24 +93,33 @@ class VectorStoreService:
             logger.error("Vector query failed: %s", e)
             return []
 
-        items = []
-        if results and results["documents"]:
-            for i, doc in enumerate(results["documents"][0]):
-                meta = results["metadatas"][0][i] if results["metadatas"] else {}
-                distance = results["distances"][0][i] if results["distances"] else 1.0
-                items.append({
-                    "chunk_text": doc,
-                    "filename": meta.get("filename", "unknown"),
-                    "page": meta.get("page", 0),
-                    "score": round(1 - distance, 4),
-                    "doc_id": meta.get("doc_id", ""),
-                })
-        return items
+        if not results or not results["documents"]:
+            return []
+
+        docs = results["documents"][0]
+        metas = results["metadatas"][0] if results["metadatas"] else [{}] * len(docs)
+        if results["distances"]:
+            # Unrounded: confidence thresholds and the UI's "% match" don't
+            # need it.
+            scores = (1.0 - np.asarray(results["distances"][0], dtype=np.float64)).tolist()
+        else:
+            scores = [0.0] * len(docs)
+        return [
+            {
+                "chunk_text": doc,
+                "filename": meta.get("filename", "unknown"),
+                "page": meta.get("page", 0),
+                "score": score,
+                "doc_id": meta.get("doc_id", ""),
+            }
+            for doc, meta, score in zip(docs, metas, scores)
+        ]
 
     def delete_document(self, workspace_id: str, doc_id: str):
         try:
             collection = self.get_or_create_collection(workspace_id)
-            all_ids = collection.get(where={"doc_id": doc_id})
+            # Only the ids are needed; skip loading texts and metadata.
+            all_ids = collection.get(where={"doc_id": doc_id}, include=[])
             if all_ids and all_ids["ids"]:
                 collection.delete(ids=all_ids["ids"])
                 logger.info("Deleted %d chunks for doc %s", len(all_ids["ids"]), doc_id)
@@ -103,6 +127,7 @@ class VectorStoreService:
             logger.error("Failed to delete doc vectors: %s", e)
 
     def delete_collection(self, workspace_id: str):
+        self._collections.pop(workspace_id, None)
         name = self._collection_name(workspace_id)
         try:
             self.client.delete_collection(name)
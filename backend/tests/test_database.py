@@ -0,0 +1,44 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import MIGRATIONS
+
+
+def _plan(db: sqlite3.Connection, sql: str, params=()) -> str:
+    rows = db.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return "\n".join(row[3] for row in rows)
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(";\n".join(MIGRATIONS))
+    yield conn
+    conn.close()
+
+
+class TestListingPlans:
+    def test_templates_by_category(self, db):
+        plan = _plan(
+            db,
+            "SELECT * FROM prompt_templates WHERE category = ? ORDER BY is_builtin DESC, name ASC",
+            ("general",),
+        )
+        assert "USING INDEX idx_templates_cat_builtin_name" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_all_templates(self, db):
+        plan = _plan(db, "SELECT * FROM prompt_templates ORDER BY is_builtin DESC, name ASC")
+        assert "USING INDEX idx_templates_builtin_name" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_workspaces_by_update(self, db):
+        plan = _plan(db, "SELECT * FROM workspaces ORDER BY updated_at DESC")
+        assert "USING INDEX idx_workspaces_updated" in plan
+        assert "TEMP B-TREE" not in plan
+
@@ -0,0 +1,53 @@
+"""Integration tests for the document endpoints."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import database
+from main import app, lifespan
+from routers import documents
+
+
+async def _start(app):
+    ctx = lifespan(app)
+    await ctx.__aenter__()
+    await database._migration_task
+    return ctx
+
+
+@pytest.mark.asyncio
+async def test_document_interrupted_mid_ingest_can_be_deleted_after_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "local_ai.db"))
+
+    async def remove_document(workspace_id, doc_id):
+        pass
+
+    monkeypatch.setattr(documents.doc_service, "remove_document", remove_document)
+
+    ctx = await _start(app)
+    async with database.get_write_db() as db:
+        await db.execute("INSERT INTO workspaces (id, name, created_at, updated_at) VALUES ('w', 'w', 0, 0)")
+        await db.execute(
+            """INSERT INTO documents (id, workspace_id, filename, file_path, file_hash, file_size, status, created_at)
+               VALUES ('d', 'w', 'a.txt', ?, 'hash', 1, 'processing', 0)""",
+            (str(tmp_path / "a.txt"),),
+        )
+        await db.commit()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.delete("/api/documents/w/d")).status_code == 409
+    # The server stops while the ingest is still running.
+    await ctx.__aexit__(None, None, None)
+
+    ctx = await _start(app)
+    try:
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            listed = (await client.get("/api/documents/w")).json()
+            assert [(d["status"], d["error_message"]) for d in listed] == [("error", "Ingestion was interrupted")]
+            assert (await client.delete("/api/documents/w/d")).status_code == 200
+    finally:
+        await ctx.__aexit__(None, None, None)
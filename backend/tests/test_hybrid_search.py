@@ -199,6 +199,25 @@ def test_combine_results(hybrid_service):
     assert "bm25_score" in doc2
 
 
+def test_combine_results_rank_fusion(hybrid_service):
+    """Test fusion depends on ranks, not on the scale of each list's scores."""
+    vector_results = [
+        {"chunk_text": "doc1", "score": 0.9},
+        {"chunk_text": "doc2", "score": 0.8},
+    ]
+    bm25_results = [
+        {"chunk_text": "doc1", "score": 42.0},
+        {"chunk_text": "doc3", "score": 0.1},
+    ]
+
+    combined = hybrid_service._combine_results(vector_results, bm25_results, 0.7, 0.3)
+    scores = {r["chunk_text"]: r["score"] for r in combined}
+
+    # First in both lists is the best possible fused score.
+    assert scores["doc1"] == pytest.approx(1.0)
+    assert scores["doc2"] > scores["doc3"]
+
+
 @pytest.mark.asyncio
 async def test_recursive_retrieval_high_confidence(hybrid_service):
     """Test recursive retrieval with high-confidence results."""
@@ -272,3 +291,104 @@ def test_delete_nonexistent_index(hybrid_service):
     """Test deleting non-existent index doesn't error."""
     # Should not raise error
     hybrid_service.delete_index("nonexistent_workspace")
+
+
+def test_unchanged_corpus_skips_rebuild(hybrid_service, sample_documents):
+    """Test re-indexing identical documents keeps the existing index."""
+    workspace_id = "test_workspace"
+
+    hybrid_service.index_documents_for_bm25(workspace_id, sample_documents)
+    index = hybrid_service.bm25_indices[workspace_id]["index"]
+
+    hybrid_service.index_documents_for_bm25(workspace_id, list(sample_documents))
+    assert hybrid_service.bm25_indices[workspace_id]["index"] is index
+
+
+def test_persisted_index_shared_between_instances(tmp_path, sample_documents):
+    """Test an index built by one instance is searchable from another."""
+    workspace_id = "test_workspace"
+    builder = HybridSearchService(index_dir=tmp_path)
+    searcher = HybridSearchService(index_dir=tmp_path)
+
+    builder.index_documents_for_bm25(workspace_id, sample_documents[:3])
+    assert searcher.search_bm25(workspace_id, "neural networks", top_k=3)
+
+    # A rebuild by the first instance is picked up by the second.
+    builder.index_documents_for_bm25(workspace_id, sample_documents)
+    results = searcher.search_bm25(workspace_id, "reinforcement", top_k=3)
+    assert any("Reinforcement" in r["chunk_text"] for r in results)
+
+    builder.delete_index(workspace_id)
+    assert searcher.search_bm25(workspace_id, "neural networks", top_k=3) == []
+
+
+def test_instances_share_loaded_indices(tmp_path, sample_documents):
+    """Test instances persisting to one directory keep a single in-memory copy."""
+    first = HybridSearchService(index_dir=tmp_path)
+    second = HybridSearchService(index_dir=tmp_path)
+
+    first.index_documents_for_bm25("test_workspace", sample_documents)
+    assert second.bm25_indices["test_workspace"] is first.bm25_indices["test_workspace"]
+
+
+def test_persisted_index_survives_restart(tmp_path, sample_documents, monkeypatch):
+    """Test a new process loads the index from disk."""
+    builder = HybridSearchService(index_dir=tmp_path)
+    builder.index_documents_for_bm25("test_workspace", sample_documents)
+
+    monkeypatch.setattr("services.hybrid_search._shared_indices", {})
+    restarted = HybridSearchService(index_dir=tmp_path)
+    results = restarted.search_bm25("test_workspace", "neural networks", top_k=1)
+    assert "neural networks" in results[0]["chunk_text"]
+
+
+def test_bm25_ignores_punctuation(hybrid_service, sample_documents):
+    """Test terms match even when followed by punctuation in the document."""
+    workspace_id = "test_workspace"
+    hybrid_service.index_documents_for_bm25(workspace_id, sample_documents)
+
+    results = hybrid_service.search_bm25(workspace_id, "Rewards?", top_k=1)
+
+    assert len(results) == 1
+    assert "rewards" in results[0]["chunk_text"]
+
+
+def test_sparse_bm25_matches_rank_bm25(sample_documents):
+    """Test SparseBM25 scores agree with the reference rank_bm25 implementation."""
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    from services.hybrid_search import SparseBM25, _tokenize
+
+    corpus = [_tokenize(doc) for doc in sample_documents]
+    reference = rank_bm25.BM25Okapi(corpus)
+    sparse = SparseBM25(corpus)
+
+    for query in ["learning", "neural networks", "language language", "missing term"]:
+        tokens = _tokenize(query)
+        assert sparse.get_scores(tokens) == pytest.approx(reference.get_scores(tokens))
+
+
+def test_extended_index_matches_full_build(sample_documents):
+    """Test appending documents scores exactly like building from scratch."""
+    from services.hybrid_search import SparseBM25, _tokenize
+
+    corpus = [_tokenize(doc) for doc in sample_documents]
+    extended = SparseBM25(corpus[:2])
+    extended.extend(corpus[2:])
+    full = SparseBM25(corpus)
+
+    for query in ["learning", "neural networks", "language language", "missing term"]:
+        tokens = _tokenize(query)
+        assert extended.get_scores(tokens) == pytest.approx(full.get_scores(tokens))
+
+
+def test_appended_documents_extend_existing_index(hybrid_service, sample_documents):
+    """Test an update that only appends documents leaves the old index untouched."""
+    workspace_id = "test_workspace"
+    hybrid_service.index_documents_for_bm25(workspace_id, sample_documents[:3])
+    old_index = hybrid_service.bm25_indices[workspace_id]["index"]
+
+    hybrid_service.update_index(workspace_id, sample_documents)
+
+    assert old_index.corpus_size == 3
+    results = hybrid_service.search_bm25(workspace_id, "reinforcement", top_k=1)
+    assert "Reinforcement" in results[0]["chunk_text"]
@@ -0,0 +1,29 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.ids import uuid7
+
+
+class TestUuid7:
+    def test_version_and_variant(self):
+        u = uuid7()
+        assert u.version == 7
+        assert u.variant == "specified in RFC 4122"
+
+    def test_embeds_current_time(self):
+        before = time.time_ns() // 1_000_000
+        u = uuid7()
+        after = time.time_ns() // 1_000_000
+        assert before <= u.int >> 80 <= after
+
+    def test_sorts_by_creation_time(self):
+        first = uuid7()
+        time.sleep(0.002)
+        second = uuid7()
+        assert str(first) < str(second)
+
+    def test_unique(self):
+        assert len({uuid7() for _ in range(1000)}) == 1000
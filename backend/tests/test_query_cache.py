@@ -0,0 +1,94 @@
+"""Tests for the query embedding and search-result caches."""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.query_cache import (
+    EmbeddingStore,
+    SemanticQueryCache,
+    mark_workspace_changed,
+    workspace_generation,
+)
+
+SCOPE = ("ws", 0, "vector", 5, False)
+RESULTS = [{"chunk_text": "cached", "score": 0.9}]
+
+
+def test_similar_query_hits():
+    cache = SemanticQueryCache()
+    cache.put(SCOPE, [1.0, 0.0, 0.0], RESULTS)
+
+    assert cache.get(SCOPE, [0.99, 0.05, 0.0]) == RESULTS
+
+
+def test_dissimilar_query_misses():
+    cache = SemanticQueryCache()
+    cache.put(SCOPE, [1.0, 0.0, 0.0], RESULTS)
+
+    assert cache.get(SCOPE, [0.0, 1.0, 0.0]) is None
+
+
+def test_other_scope_misses():
+    cache = SemanticQueryCache()
+    cache.put(SCOPE, [1.0, 0.0, 0.0], RESULTS)
+
+    assert cache.get(("other", 0, "vector", 5, False), [1.0, 0.0, 0.0]) is None
+
+
+def test_returned_results_are_copies():
+    cache = SemanticQueryCache()
+    cache.put(SCOPE, [1.0, 0.0, 0.0], RESULTS)
+
+    cache.get(SCOPE, [1.0, 0.0, 0.0])[0]["score"] = 0.0
+    assert cache.get(SCOPE, [1.0, 0.0, 0.0])[0]["score"] == 0.9
+
+
+def test_oldest_entry_evicted():
+    cache = SemanticQueryCache(max_entries=2)
+    cache.put(SCOPE, [1.0, 0.0, 0.0], [{"chunk_text": "a"}])
+    cache.put(SCOPE, [0.0, 1.0, 0.0], [{"chunk_text": "b"}])
+    cache.put(SCOPE, [0.0, 0.0, 1.0], [{"chunk_text": "c"}])
+
+    assert cache.get(SCOPE, [1.0, 0.0, 0.0]) is None
+    assert cache.get(SCOPE, [0.0, 1.0, 0.0]) == [{"chunk_text": "b"}]
+    assert cache.get(SCOPE, [0.0, 0.0, 1.0]) == [{"chunk_text": "c"}]
+
+
+def test_workspace_change_bumps_generation():
+    before = workspace_generation("changed-ws")
+    mark_workspace_changed("changed-ws")
+
+    assert workspace_generation("changed-ws") == before + 1
+
+
+def test_embedding_store_survives_reopen(tmp_path):
+    vector = np.asarray([0.1, -0.2, 1 / 3], dtype=np.float32).tolist()
+    store = EmbeddingStore(tmp_path / "emb.sqlite")
+    store.put("model", b"digest", vector)
+    store.close()
+
+    reopened = EmbeddingStore(tmp_path / "emb.sqlite")
+    assert reopened.get("model", b"digest") == vector
+    assert reopened.get("other-model", b"digest") is None
+    reopened.close()
+
+
+def test_embedding_store_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr("services.query_cache.EVICT_EVERY", 3)
+    store = EmbeddingStore(tmp_path / "emb.sqlite", max_entries=2)
+    store.put("model", b"a", [1.0])
+    time.sleep(0.01)
+    store.put("model", b"b", [2.0])
+    time.sleep(0.01)
+    store.get("model", b"a")
+    time.sleep(0.01)
+    store.put("model", b"c", [3.0])
+
+    assert store.get("model", b"b") is None
+    assert store.get("model", b"a") == [1.0]
+    assert store.get("model", b"c") == [3.0]
+    store.close()
@@ -1,12 +1,28 @@
 import sys
 import tempfile
+import zipfile
 from pathlib import Path
 
+import pytest
+
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from utils.text_extraction import extract_text
 
 
+@pytest.fixture(autouse=True)
+def _extract_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.text_extraction.EXTRACT_CACHE_DIR", tmp_path / "extract_cache")
+
+
+@pytest.fixture
+def process_pool():
+    from utils.process_pool import shutdown_process_pool
+
+    yield
+    shutdown_process_pool()
+
+
 class TestExtractPlainText:
     def test_txt_file(self):
         with tempfile.NamedTemporaryFile(suffix=".txt", mode="w", delete=False) as f:
@@ -26,6 +42,11 @@ class TestExtractPlainText:
         assert len(result) == 1
         assert "Heading" in result[0][1]
 
+    def test_md_frontmatter_parsed(self, tmp_path):
+        path = tmp_path / "note.md"
+        path.write_text("---\ntitle: Notes\ntags: [a, b]\n---\n# Heading\n\nBody.")
+        assert extract_text(str(path)) == [(1, "title: Notes\ntags: ['a', 'b']\n\n# Heading\n\nBody.")]
+
     def test_empty_file(self):
         with tempfile.NamedTemporaryFile(suffix=".txt", mode="w", delete=False) as f:
             f.write("")
@@ -48,6 +69,23 @@ class TestExtractPlainText:
         assert len(result) == 1
         assert "Cześć" in result[0][1]
 
+    def test_utf8_bom_stripped(self, tmp_path):
+        path = tmp_path / "bom.txt"
+        path.write_bytes(b"\xef\xbb\xbfHello with a BOM.")
+        assert extract_text(str(path)) == [(1, "Hello with a BOM.")]
+
+    def test_non_utf8_content_detected(self, tmp_path):
+        path = tmp_path / "latin1.txt"
+        path.write_bytes("Le café est très populaire à Paris. ".encode("latin-1") * 20)
+        result = extract_text(str(path))
+        assert "café" in result[0][1]
+
+    def test_non_utf8_bytes_after_long_ascii_prefix(self, tmp_path):
+        path = tmp_path / "late_latin1.txt"
+        path.write_bytes(b"plain ascii text. " * 5000 + "Le café est très populaire. ".encode("latin-1") * 20)
+        result = extract_text(str(path))
+        assert "café" in result[0][1]
+
     def test_unsupported_format(self):
         with tempfile.NamedTemporaryFile(suffix=".xyz", mode="w", delete=False) as f:
             f.write("content")
@@ -57,3 +95,190 @@ class TestExtractPlainText:
                 assert False, "Should have raised ValueError"
             except ValueError as e:
                 assert "Unsupported" in str(e)
+
+
+class TestExtractPdf:
+    def test_pages_numbered_and_blank_pages_skipped(self, tmp_path):
+        fitz = pytest.importorskip("fitz")
+        path = tmp_path / "doc.pdf"
+        with fitz.open() as doc:
+            doc.new_page().insert_text((72, 72), "First page text.")
+            doc.new_page()
+            doc.new_page().insert_text((72, 72), "Third page text.")
+            doc.save(str(path))
+
+        result = extract_text(str(path))
+        assert result == [(1, "First page text."), (3, "Third page text.")]
+
+    def test_parallel_extraction_keeps_page_order(self, tmp_path, monkeypatch, process_pool):
+        fitz = pytest.importorskip("fitz")
+        monkeypatch.setattr("utils.text_extraction.PDF_PARALLEL_MIN_PAGES", 2)
+        monkeypatch.setattr("os.cpu_count", lambda: 3)
+        path = tmp_path / "doc.pdf"
+        with fitz.open() as doc:
+            for n in range(1, 8):
+                doc.new_page().insert_text((72, 72), f"Page {n} text.")
+            doc.save(str(path))
+
+        result = extract_text(str(path))
+        assert result == [(n, f"Page {n} text.") for n in range(1, 8)]
+
+
+class TestExtractDocx:
+    def test_body_paragraphs_only(self, tmp_path):
+        body = (
+            '<w:p><w:r><w:t>First</w:t><w:tab/><w:t>paragraph</w:t></w:r></w:p>'
+            '<w:p/>'
+            '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Table cell</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+            '<w:p><w:hyperlink><w:r><w:t>Link</w:t></w:r></w:hyperlink>'
+            '<w:r><w:br/><w:t>after break</w:t><w:br w:type="page"/></w:r></w:p>'
+        )
+        path = tmp_path / "doc.docx"
+        with zipfile.ZipFile(path, "w") as package:
+            package.writestr(
+                "_rels/.rels",
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Target="word/document.xml" Type="http://schemas.openxmlformats.org/'
+                'officeDocument/2006/relationships/officeDocument"/></Relationships>',
+            )
+            package.writestr(
+                "word/document.xml",
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f"<w:body>{body}</w:body></w:document>",
+            )
+
+        result = extract_text(str(path))
+        assert result == [(1, "First\tparagraph\nLink\nafter break")]
+
+
+class TestExtractHtml:
+    def test_scripts_styles_and_comments_dropped(self, tmp_path):
+        path = tmp_path / "page.html"
+        path.write_text(
+            "<html><head><title>Page title</title><style>p { color: red }</style></head>"
+            "<body><p>First <b>bold</b> line</p><!-- hidden --><script>var x = 1;</script>"
+            "<div>  Second\n\n  block  </div></body></html>"
+        )
+        result = extract_text(str(path))
+        assert result == [(1, "Page title\nFirst\nbold\nline\nSecond\nblock")]
+
+    def test_empty_html(self, tmp_path):
+        path = tmp_path / "empty.html"
+        path.write_text("  <!-- nothing -->  ")
+        assert extract_text(str(path)) == []
+
+
+class TestExtractEpub:
+    def test_chapters_parsed_in_parallel_keep_book_order(self, tmp_path, monkeypatch):
+        epub = pytest.importorskip("ebooklib.epub")
+        monkeypatch.setattr("os.cpu_count", lambda: 3)
+        book = epub.EpubBook()
+        book.set_identifier("test-book")
+        book.set_title("Test Book")
+        chapters = []
+        for n in range(1, 6):
+            chapter = epub.EpubHtml(title=f"Chapter {n}", file_name=f"ch{n}.xhtml")
+            body = "<script>skipped()</script>" if n == 3 else f"<p>Chapter {n} text.</p>"
+            chapter.content = f"<html><body>{body}</body></html>"
+            book.add_item(chapter)
+            chapters.append(chapter)
+        book.add_item(epub.EpubNcx())
+        book.spine = chapters
+        path = tmp_path / "book.epub"
+        epub.write_epub(str(path), book)
+
+        result = extract_text(str(path))
+
+        assert result == [(1, "Chapter 1 text."), (2, "Chapter 2 text."), (3, "Chapter 4 text."), (4, "Chapter 5 text.")]
+
+
+class TestExtractExcel:
+    def test_sheet_summary(self, tmp_path):
+        openpyxl = pytest.importorskip("openpyxl")
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = "Prices"
+        sheet.append(["item", "price", 2024])
+        for n in range(12):
+            sheet.append([f"item{n}", n + 0.5])
+        sheet.append([])
+        workbook.create_sheet("Empty")
+        path = tmp_path / "book.xlsx"
+        workbook.save(path)
+
+        result = extract_text(str(path))
+
+        assert [num for num, _ in result] == [1, 2]
+        prices = result[0][1]
+        assert prices.startswith("Sheet: Prices\nColumns: item, price, 2024\nTotal rows: 12\n")
+        assert "item9" in prices and "item10" not in prices
+        assert result[1][1].startswith("Sheet: Empty\nColumns: \nTotal rows: 0")
+
+
+class TestExtractTextBatch:
+    def test_results_per_file_with_errors_isolated(self, tmp_path, monkeypatch, process_pool):
+        from utils.text_extraction import extract_text_batch
+
+        good = [tmp_path / f"doc{n}.txt" for n in range(3)]
+        for n, path in enumerate(good):
+            path.write_text(f"Document number {n}.")
+        bad = tmp_path / "doc.xyz"
+        bad.write_text("content")
+
+        monkeypatch.setattr("os.cpu_count", lambda: 3)
+        extract_text(str(good[0]))  # Served from the cache, not the pool.
+
+        results = dict(extract_text_batch([str(p) for p in [*good, bad]]))
+
+        for n, path in enumerate(good):
+            assert results[str(path)] == [(1, f"Document number {n}.")]
+        assert isinstance(results[str(bad)], ValueError)
+        # Parsed in the pool, cached by the caller.
+        assert len(list((tmp_path / "extract_cache").iterdir())) == 3
+
+
+class TestExtractionCache:
+    def test_unchanged_file_served_from_cache(self, tmp_path, monkeypatch):
+        from utils.text_extraction import _EXTRACTORS
+
+        path = tmp_path / "doc.txt"
+        path.write_text("Original text.")
+        assert extract_text(str(path)) == [(1, "Original text.")]
+
+        def fail(path):
+            raise AssertionError("file parsed again")
+
+        monkeypatch.setitem(_EXTRACTORS, ".txt", fail)
+        assert extract_text(str(path)) == [(1, "Original text.")]
+
+    def test_modified_file_extracted_again(self, tmp_path):
+        path = tmp_path / "doc.txt"
+        path.write_text("Original text.")
+        extract_text(str(path))
+
+        path.write_text("Edited text, now longer.")
+        assert extract_text(str(path)) == [(1, "Edited text, now longer.")]
+
+    def test_cache_bypassed(self, tmp_path):
+        path = tmp_path / "doc.txt"
+        path.write_text("Some text.")
+
+        assert extract_text(str(path), use_cache=False) == [(1, "Some text.")]
+        assert not (tmp_path / "extract_cache").exists()
+
+    def test_empty_result_not_cached(self, tmp_path):
+        path = tmp_path / "blank.txt"
+        path.write_text("   ")
+
+        assert extract_text(str(path)) == []
+        assert not (tmp_path / "extract_cache").exists()
+
+    def test_forget_extraction_drops_entry(self, tmp_path):
+        from utils.text_extraction import forget_extraction
+
+        path = tmp_path / "doc.txt"
+        path.write_text("Some text.")
+        extract_text(str(path))
+
+        forget_extraction(str(path))
+        assert not list((tmp_path / "extract_cache").iterdir())
@@ -11,10 +11,18 @@ Includes:
 
 import logging
 import re
+import string
+from bisect import bisect_left
 from typing import TypedDict
 
+from utils.chunking import _chunk_by_size, _chunk_ranges, _split_sentences
+
 logger = logging.getLogger(__name__)
 
+_TABLE_LINE_RE = re.compile(r'\s{3,}|\t{2,}')
+_MD_HEADING_RE = re.compile(r'^#{1,6}\s+(.+)$', re.MULTILINE)
+_ASCII_ALNUM = (string.ascii_letters + string.digits).encode()
+
 
 class ChunkMetadata(TypedDict, total=False):
     """Metadata for enriched chunks."""
@@ -94,10 +102,12 @@ def hierarchical_chunk_text(
     chunks = []
 
     # Create parent chunks
-    parent_chunks = _chunk_by_size(sentences, parent_chunk_size, overlap)
+    parent_ranges = _chunk_ranges(sentences, parent_chunk_size, overlap)
 
     chunk_index = 0
-    for parent_idx, parent_text in enumerate(parent_chunks):
+    for start, end in parent_ranges:
+        parent_sentences = sentences[start:end]
+        parent_text = " ".join(parent_sentences)
         # Add parent chunk
         chunks.append({
             "text": parent_text,
@@ -111,8 +121,8 @@ def hierarchical_chunk_text(
         parent_chunk_idx = chunk_index
         chunk_index += 1
 
-        # Create child chunks from parent
-        parent_sentences = _split_sentences(parent_text)
+        # Create child chunks from the parent's sentences; re-splitting the
+        # joined parent text would give back the same list.
         child_chunks = _chunk_by_size(parent_sentences, child_chunk_size, overlap // 2)
 
         for child_text in child_chunks:
@@ -222,12 +232,13 @@ def enrich_chunks_with_metadata(
     Extracts headings and associates them with relevant chunks.
     """
     headings = _extract_headings(full_text)
+    heading_offsets, heading_texts = _heading_offsets(headings, full_text)
 
     for chunk in chunks:
         chunk_text = chunk["text"]
 
         # Find the most relevant heading for this chunk
-        heading = _find_relevant_heading(chunk_text, headings, full_text)
+        heading = _find_relevant_heading(chunk_text, headings, full_text, heading_offsets, heading_texts)
         if heading:
             chunk["metadata"]["heading"] = heading
             chunk["metadata"]["section"] = heading
@@ -249,7 +260,8 @@ def _calculate_quality_score(text: str) -> float:
     - Repetitive content
     - Low information density
     """
-    if not text or not text.strip():
+    stripped = text.strip() if text else ""
+    if not stripped:
         return 0.0
 
     score = 1.0
@@ -260,9 +272,9 @@ def _calculate_quality_score(text: str) -> float:
     elif len(text) < 100:
         score *= 0.8
 
-    # Header-only detection
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    if len(lines) == 1 and len(lines[0]) < 50:
+    # Header-only detection: the stripped text is a single non-empty line
+    # exactly when it has no newline left in it.
+    if "\n" not in stripped and len(stripped) < 50:
         score *= 0.6
 
     # Check for meaningful content
@@ -271,27 +283,24 @@ def _calculate_quality_score(text: str) -> float:
         score *= 0.7
 
     # Repetition penalty
-    unique_words = len(set(word.lower() for word in words))
-    if len(words) > 0:
-        uniqueness_ratio = unique_words / len(words)
-        if uniqueness_ratio < 0.3:  # Very repetitive
-            score *= 0.5
+    unique_words = len({word.lower() for word in words})
+    uniqueness_ratio = unique_words / len(words)
+    if uniqueness_ratio < 0.3:  # Very repetitive
+        score *= 0.5
 
     # Information density (alphanumeric ratio)
-    alphanumeric = sum(c.isalnum() for c in text)
-    if len(text) > 0:
-        density = alphanumeric / len(text)
-        if density < 0.4:  # Too many special chars/whitespace
-            score *= 0.8
+    density = _count_alnum(text) / len(text)
+    if density < 0.4:  # Too many special chars/whitespace
+        score *= 0.8
 
     return round(score, 3)
 
 
-def _split_sentences(text: str) -> list[str]:
-    """Split text into sentences."""
-    text = re.sub(r'\s+', ' ', text).strip()
-    parts = re.split(r'(?<=[.!?])\s+', text)
-    return [p.strip() for p in parts if p.strip()]
+def _count_alnum(text: str) -> int:
+    """Count str.isalnum() characters; ASCII text takes a C-level fast path."""
+    if text.isascii():
+        return len(text) - len(text.encode().translate(None, _ASCII_ALNUM))
+    return sum(map(str.isalnum, text))
 
 
 def _semantic_chunk_heuristic(
@@ -329,43 +338,6 @@ def _semantic_chunk_heuristic(
     return chunks
 
 
-def _chunk_by_size(
-    sentences: list[str],
-    chunk_size: int,
-    overlap: int,
-) -> list[str]:
-    """Chunk sentences by size with overlap."""
-    chunks = []
-    current_chunk = []
-    current_length = 0
-
-    for sentence in sentences:
-        sentence_len = len(sentence)
-
-        if current_length + sentence_len > chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-
-            # Create overlap
-            overlap_chunk = []
-            overlap_len = 0
-            for s in reversed(current_chunk):
-                if overlap_len + len(s) > overlap:
-                    break
-                overlap_chunk.insert(0, s)
-                overlap_len += len(s)
-
-            current_chunk = overlap_chunk
-            current_length = overlap_len
-
-        current_chunk.append(sentence)
-        current_length += sentence_len
-
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-
-    return chunks
-
-
 def _detect_table_regions(text: str) -> list[tuple[int, int]]:
     """
     Detect table-like regions in text.
@@ -380,7 +352,7 @@ def _detect_table_regions(text: str) -> list[tuple[int, int]]:
 
     for i, line in enumerate(lines):
         # Heuristic: line with multiple consecutive spaces or tabs
-        is_table_line = bool(re.search(r'\s{3,}|\t{2,}', line))
+        is_table_line = bool(_TABLE_LINE_RE.search(line))
 
         if is_table_line and not in_table:
             in_table = True
@@ -399,7 +371,7 @@ def _extract_headings(text: str) -> list[str]:
     headings = []
 
     # Markdown headings
-    md_headings = re.findall(r'^#{1,6}\s+(.+)$', text, re.MULTILINE)
+    md_headings = _MD_HEADING_RE.findall(text)
     headings.extend(md_headings)
 
     # All-caps lines (potential headings)
@@ -412,26 +384,35 @@ def _extract_headings(text: str) -> list[str]:
     return headings
 
 
-def _find_relevant_heading(chunk_text: str, headings: list[str], full_text: str) -> str:
-    """Find the most relevant heading for a chunk."""
+def _heading_offsets(headings: list[str], full_text: str) -> tuple[list[int], list[str]]:
+    """
+    Locate each heading's first occurrence once, as parallel lists sorted by
+    offset. Where several headings share an offset the earliest listed wins.
+    """
+    by_offset: dict[int, str] = {}
+    for heading in headings:
+        pos = full_text.find(heading)
+        if pos != -1:
+            by_offset.setdefault(pos, heading)
+    offsets = sorted(by_offset)
+    return offsets, [by_offset[pos] for pos in offsets]
+
+
+def _find_relevant_heading(
+    chunk_text: str,
+    headings: list[str],
+    full_text: str,
+    heading_offsets: list[int],
+    heading_texts: list[str],
+) -> str:
+    """Find the closest heading that starts before the chunk."""
     if not headings:
         return ""
 
     # Find position of chunk in full text
     chunk_pos = full_text.find(chunk_text)
     if chunk_pos == -1:
-        return headings[0] if headings else ""
+        return headings[0]
 
-    # Find the closest heading before this chunk
-    best_heading = ""
-    best_distance = float('inf')
-
-    for heading in headings:
-        heading_pos = full_text.find(heading)
-        if heading_pos != -1 and heading_pos < chunk_pos:
-            distance = chunk_pos - heading_pos
-            if distance < best_distance:
-                best_distance = distance
-                best_heading = heading
-
-    return best_heading
+    idx = bisect_left(heading_offsets, chunk_pos) - 1
+    return heading_texts[idx] if idx >= 0 else ""
@@ -1,3 +1,9 @@
+from bisect import bisect_left
+
+# Sentence terminators; a sentence ends at one followed by whitespace.
+_SENTENCE_ENDS = (". ", "! ", "? ")
+
+
 def chunk_text(
     text: str,
     chunk_size: int = 512,
@@ -36,40 +42,53 @@ def chunk_text(
         return [chunk["text"] for chunk in enriched if not chunk["metadata"].get("is_parent", False)]
 
     # Default: sentence-based chunking
-    sentences = _split_sentences(text)
-    chunks = []
-    current_chunk: list[str] = []
-    current_length = 0
+    chunks = _chunk_by_size(_split_sentences(text), chunk_size, chunk_overlap)
+    return [c.strip() for c in chunks if c.strip()]
+
 
-    for sentence in sentences:
-        sentence_len = len(sentence)
+def _chunk_by_size(sentences: list[str], chunk_size: int, overlap: int) -> list[str]:
+    """Pack sentences into overlapping chunks; see _chunk_ranges."""
+    return [" ".join(sentences[start:end]) for start, end in _chunk_ranges(sentences, chunk_size, overlap)]
 
-        if current_length + sentence_len > chunk_size and current_chunk:
-            chunks.append(" ".join(current_chunk))
 
-            overlap_chunk: list[str] = []
-            overlap_len = 0
-            for s in reversed(current_chunk):
-                if overlap_len + len(s) > chunk_overlap:
-                    break
-                overlap_chunk.insert(0, s)
-                overlap_len += len(s)
+def _chunk_ranges(sentences: list[str], chunk_size: int, overlap: int) -> list[tuple[int, int]]:
+    """
+    Group sentences into chunks of at most chunk_size characters (not
+    counting joining spaces), returned as (start, end) slices of sentences.
+    Each new chunk starts with the longest run of trailing sentences from the
+    previous one totalling no more than overlap.
+    """
+    ranges = []
+    start = 0
+    # prefix[i] is the total length of sentences[start:start + i].
+    prefix = [0]
 
-            current_chunk = overlap_chunk
-            current_length = overlap_len
+    for i, sentence in enumerate(sentences):
+        if prefix[-1] + len(sentence) > chunk_size and i > start:
+            ranges.append((start, i))
+            # First sentence whose suffix through i - 1 fits in the overlap.
+            tail = bisect_left(prefix, prefix[-1] - overlap)
+            base = prefix[tail]
+            prefix = [p - base for p in prefix[tail:]]
+            start += tail
 
-        current_chunk.append(sentence)
-        current_length += sentence_len
+        prefix.append(prefix[-1] + len(sentence))
 
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+    if start < len(sentences):
+        ranges.append((start, len(sentences)))
 
-    return [c.strip() for c in chunks if c.strip()]
+    return ranges
 
 
 def _split_sentences(text: str) -> list[str]:
-    import re
-
-    text = re.sub(r"\s+", " ", text).strip()
-    parts = re.split(r"(?<=[.!?])\s+", text)
-    return [p.strip() for p in parts if p.strip()]
+    # Collapse whitespace runs to single spaces and strip; str.split() uses
+    # the same notion of whitespace as \s and is several times faster than a
+    # regex substitution. Afterwards no newlines are left, so one can mark
+    # each sentence end without regex lookbehind. Every piece is non-empty
+    # and trimmed.
+    text = " ".join(text.split())
+    if not text:
+        return []
+    for end in _SENTENCE_ENDS:
+        text = text.replace(end, end[0] + "\n")
+    return text.split("\n")
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from config import settings
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+# Set in the pool's own workers, so work running there doesn't try to fan
+# out over the pool again.
+_in_worker = False
+
+
+def pool_workers() -> int:
+    """
+    Number of processes CPU-bound work can spread over: settings.extract_workers,
+    or one less than the CPU count. 1 inside a pool worker.
+    """
+    if _in_worker:
+        return 1
+    return settings.extract_workers or max((os.cpu_count() or 1) - 1, 1)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    The process pool shared by text extraction, created on first use.
+
+    Workers are spawned rather than forked: the server process runs
+    aiosqlite, Chroma and to_thread workers, and forking a process with
+    live threads can deadlock the child on a lock some other thread held.
+    The pool lives until shutdown_process_pool(), so each document doesn't
+    pay for starting interpreters.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=pool_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def shutdown_process_pool():
+    """Stop the shared pool's workers (idempotent)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
@@ -1,96 +1,282 @@
+import codecs
+import hashlib
 import logging
+import mmap
+import os
+import pickle
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+from config import settings
+from utils.process_pool import get_process_pool, pool_workers
+
+try:
+    # Compiled and fastest when installed (faust-cchardet provides it).
+    from cchardet import detect as _detect_charset
+except ImportError:
+    from charset_normalizer import detect as _detect_charset
+
 logger = logging.getLogger(__name__)
 
+# PDFs with fewer pages are extracted in-process; at a millisecond or two
+# per page, shipping page ranges to workers would cost more than it saves.
+PDF_PARALLEL_MIN_PAGES = 32
+
+# Bytes of a non-UTF-8 file the charset detector examines; a sample is
+# enough to identify the encoding.
+ENCODING_SAMPLE_BYTES = 32 * 1024
+
+# Extraction results kept on disk, one entry per source file, so re-ingesting
+# or previewing an unchanged file skips parsing it again.
+EXTRACT_CACHE_DIR = settings.data_dir / "extract_cache"
+
+# Bump when an extractor's output changes so stale entries are ignored.
+_CACHE_VERSION = 1
+
+# Rows of each spreadsheet shown as sample data.
+EXCEL_SAMPLE_ROWS = 10
+
+# WordprocessingML tags read when extracting DOCX text.
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_BODY = f"{_W}body"
+_W_P = f"{_W}p"
+_W_R = f"{_W}r"
+_W_HYPERLINK = f"{_W}hyperlink"
+_W_T = f"{_W}t"
+_W_BR = f"{_W}br"
+_W_TYPE = f"{_W}type"
+# Text equivalents of the other run elements python-docx renders.
+_W_RUN_CHARS = {f"{_W}tab": "\t", f"{_W}ptab": "\t", f"{_W}cr": "\n", f"{_W}noBreakHyphen": "-"}
+
 
-def extract_text(file_path: str) -> list[tuple[int, str]]:
-    """Extract text from a file. Returns list of (page_number, text) tuples."""
+def extract_text(file_path: str, use_cache: bool = True) -> list[tuple[int, str]]:
+    """
+    Extract text from a file. Returns list of (page_number, text) tuples.
+
+    Results are cached under EXTRACT_CACHE_DIR and reused while the file's
+    modification time and size are unchanged; pass use_cache=False to
+    always parse the file.
+    """
     path = Path(file_path)
-    ext = path.suffix.lower()
+    extractor = _extractor(path)
+    if not use_cache:
+        return extractor(path)
+
+    cache_key, pages = _cache_lookup(path)
+    if pages is None:
+        pages = extractor(path)
+        _cache_store(cache_key, pages)
+    return pages
+
 
-    extractors = {
-        ".pdf": _extract_pdf,
-        ".txt": _extract_plain,
-        ".md": _extract_markdown,
-        ".docx": _extract_docx,
-        ".epub": _extract_epub,
-        ".html": _extract_html,
-        ".htm": _extract_html,
-        ".csv": _extract_csv,
-        ".xlsx": _extract_excel,
-        ".xls": _extract_excel,
-        # Source code files
-        ".py": _extract_source_code,
-        ".js": _extract_source_code,
-        ".ts": _extract_source_code,
-        ".tsx": _extract_source_code,
-        ".jsx": _extract_source_code,
-        ".rs": _extract_source_code,
-        ".go": _extract_source_code,
-        ".java": _extract_source_code,
-        ".cpp": _extract_source_code,
-        ".c": _extract_source_code,
-        ".h": _extract_source_code,
-        ".hpp": _extract_source_code,
-        ".rb": _extract_source_code,
-        ".php": _extract_source_code,
-        ".swift": _extract_source_code,
-        ".kt": _extract_source_code,
-        ".sql": _extract_source_code,
-        ".sh": _extract_source_code,
-        ".yaml": _extract_source_code,
-        ".yml": _extract_source_code,
-        ".json": _extract_source_code,
-        ".xml": _extract_source_code,
-    }
-
-    extractor = extractors.get(ext)
+def extract_text_batch(file_paths: list[str]) -> Iterator[tuple[str, list[tuple[int, str]] | Exception]]:
+    """
+    Extract text from many files across the shared worker pool.
+
+    A library entry point for bulk ingest and scripts; uploads go through
+    extract_text one file at a time. Cache lookups and writes happen here in
+    the calling process, so workers only parse.
+
+    Args:
+        file_paths: Files to extract
+
+    Yields:
+        (file_path, pages) as each file finishes, cache hits first, then in
+        completion order. A file that fails yields its exception instead of
+        pages, so one bad file doesn't stop the rest.
+    """
+    if min(pool_workers(), len(file_paths)) < 2:
+        for file_path in file_paths:
+            try:
+                yield file_path, extract_text(file_path)
+            except Exception as e:
+                yield file_path, e
+        return
+
+    pool = get_process_pool()
+    futures = {}
+    for file_path in file_paths:
+        try:
+            path = Path(file_path)
+            _extractor(path)
+            cache_key, pages = _cache_lookup(path)
+        except Exception as e:
+            yield file_path, e
+            continue
+        if pages is not None:
+            yield file_path, pages
+        else:
+            futures[pool.submit(extract_text, file_path, False)] = (file_path, cache_key)
+
+    for future in as_completed(futures):
+        file_path, cache_key = futures[future]
+        if future.exception() is not None:
+            yield file_path, future.exception()
+            continue
+        pages = future.result()
+        _cache_store(cache_key, pages)
+        yield file_path, pages
+
+
+def forget_extraction(file_path: str):
+    """Drop a file's cached extraction, e.g. once its document is deleted."""
+    cache_path = _cache_path(Path(file_path).resolve())
+    cache_path.unlink(missing_ok=True)
+
+
+def _extractor(path: Path):
+    ext = path.suffix.lower()
+    extractor = _EXTRACTORS.get(ext)
     if not extractor:
         raise ValueError(f"Unsupported file type: {ext}")
+    return extractor
 
-    return extractor(path)
+
+def _cache_lookup(path: Path) -> tuple[tuple[Path, tuple], list[tuple[int, str]] | None]:
+    """Return (cache key, cached pages or None if missing or stale) for a file."""
+    path = path.resolve()
+    st = path.stat()
+    stamp = (_CACHE_VERSION, st.st_mtime_ns, st.st_size)
+    cache_path = _cache_path(path)
+    try:
+        with open(cache_path, "rb") as f:
+            cached_stamp, pages = pickle.load(f)
+        if cached_stamp == stamp:
+            return (cache_path, stamp), pages
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable extraction cache entry {cache_path}: {e}")
+    return (cache_path, stamp), None
+
+
+def _cache_path(path: Path) -> Path:
+    return EXTRACT_CACHE_DIR / f"{hashlib.blake2b(str(path).encode(), digest_size=16).hexdigest()}.pkl"
+
+
+def _cache_store(cache_key: tuple[Path, tuple], pages: list[tuple[int, str]]):
+    # Several extractors log and return [] on failure (a missing optional
+    # parser, a file still being written); don't pin that until the file changes.
+    if not pages:
+        return
+    cache_path, stamp = cache_key
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump((stamp, pages), f, protocol=5)
+        # Atomic swap so concurrent readers never see a half-written entry.
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.warning(f"Failed to cache extracted text in {cache_path}: {e}")
+        tmp_path.unlink(missing_ok=True)
 
 
 def _extract_pdf(path: Path) -> list[tuple[int, str]]:
-    from pypdf import PdfReader
+    """
+    Extract text from PDFs with PyMuPDF, which parses in C and loads pages one at a time.
+
+    Large PDFs are split into contiguous page ranges extracted on the shared
+    process pool, each worker opening the file itself; PyMuPDF holds the
+    GIL, so threads wouldn't overlap.
+    """
+    import fitz
+
+    with fitz.open(str(path)) as doc:
+        page_count = doc.page_count
+    workers = min(pool_workers(), page_count)
+    if workers < 2 or page_count < PDF_PARALLEL_MIN_PAGES:
+        return _extract_pdf_pages(str(path), 0, page_count)
+
+    step = -(-page_count // workers)
+    starts = range(0, page_count, step)
+    ends = [min(start + step, page_count) for start in starts]
+    ranges = get_process_pool().map(_extract_pdf_pages, [str(path)] * len(starts), starts, ends)
+    return [page for pages in ranges for page in pages]
+
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> list[tuple[int, str]]:
+    """Extract the non-blank pages in [start, end) as (1-based page number, text)."""
+    import fitz
 
-    reader = PdfReader(str(path))
     pages = []
-    for i, page in enumerate(reader.pages):
-        text = page.extract_text() or ""
-        text = text.strip()
-        if text:
-            pages.append((i + 1, text))
+    with fitz.open(path) as doc:
+        for i in range(start, end):
+            text = doc[i].get_text("text").strip()
+            if text:
+                pages.append((i + 1, text))
     return pages
 
 
-def _extract_plain(path: Path) -> list[tuple[int, str]]:
-    import chardet
+def _read_text(path: Path) -> str:
+    """Decode a file through a read-only mapping, without copying it into a bytes object first."""
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _decode(mm)
+
+
+def _decode(raw: bytes | mmap.mmap) -> str:
+    """
+    Decode file contents.
 
-    raw = path.read_bytes()
-    detected = chardet.detect(raw)
-    encoding = detected.get("encoding", "utf-8") or "utf-8"
+    BOM-marked and valid UTF-8 (including plain ASCII) is decoded directly;
+    only other bytes go through charset detection.
+    """
+    if raw[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8:
+        encoding = "utf-8-sig"
+    else:
+        try:
+            return str(raw, "utf-8")
+        except UnicodeDecodeError as e:
+            # Sample around the first non-UTF-8 byte; a prefix of plain
+            # ASCII would tell the detector nothing.
+            start = max(e.start - ENCODING_SAMPLE_BYTES // 2, 0)
+            detected = _detect_charset(raw[start:start + ENCODING_SAMPLE_BYTES])
+            encoding = detected.get("encoding") or "utf-8"
 
     try:
-        text = raw.decode(encoding)
+        return str(raw, encoding)
     except (UnicodeDecodeError, LookupError):
-        text = raw.decode("utf-8", errors="replace")
+        return str(raw, "utf-8", errors="replace")
 
-    text = text.strip()
+
+def _extract_plain(path: Path) -> list[tuple[int, str]]:
+    text = _read_text(path).strip()
     if text:
         return [(1, text)]
     return []
 
 
 def _extract_docx(path: Path) -> list[tuple[int, str]]:
-    from docx import Document
+    """
+    Extract body paragraph text from a DOCX.
+
+    Streams the main document XML with lxml rather than building
+    python-docx's object model, and yields the same text as its
+    Document.paragraphs: top-level paragraphs only (not table cells), with
+    tabs and line breaks mapped to "\t" and "\n".
+    """
+    import zipfile
+
+    from lxml import etree
 
-    doc = Document(str(path))
     full_text = []
-    for paragraph in doc.paragraphs:
-        if paragraph.text.strip():
-            full_text.append(paragraph.text)
+    with zipfile.ZipFile(path) as package:
+        with package.open(_docx_main_part(package)) as xml:
+            for _, p in etree.iterparse(xml, events=("end",), tag=_W_P):
+                body = p.getparent()
+                if body.tag != _W_BODY:
+                    continue
+                text = _docx_paragraph_text(p)
+                if text.strip():
+                    full_text.append(text)
+                # Drop parsed body content so memory stays flat on long documents.
+                while p.getprevious() is not None:
+                    del body[0]
+                p.clear()
 
     text = "\n".join(full_text).strip()
     if text:
@@ -98,19 +284,48 @@ def _extract_docx(path: Path) -> list[tuple[int, str]]:
     return []
 
 
+def _docx_main_part(package) -> str:
+    """Name of the main document part, per the package relationships."""
+    from lxml import etree
+
+    rels = etree.fromstring(package.read("_rels/.rels"))
+    for rel in rels:
+        if rel.get("Type", "").endswith("/officeDocument"):
+            return rel.get("Target").lstrip("/")
+    return "word/document.xml"
+
+
+def _docx_paragraph_text(p) -> str:
+    parts = []
+    for child in p:
+        if child.tag == _W_R:
+            runs = (child,)
+        elif child.tag == _W_HYPERLINK:
+            runs = child.iterchildren(_W_R)
+        else:
+            continue
+        for run in runs:
+            for item in run:
+                tag = item.tag
+                if tag == _W_T:
+                    parts.append(item.text or "")
+                elif tag == _W_BR:
+                    # Page and column breaks have no text equivalent.
+                    if item.get(_W_TYPE, "textWrapping") == "textWrapping":
+                        parts.append("\n")
+                elif tag in _W_RUN_CHARS:
+                    parts.append(_W_RUN_CHARS[tag])
+    return "".join(parts)
+
+
 def _extract_markdown(path: Path) -> list[tuple[int, str]]:
     """Extract text from Markdown with frontmatter parsing."""
     import yaml
-    import chardet
 
-    raw = path.read_bytes()
-    detected = chardet.detect(raw)
-    encoding = detected.get("encoding", "utf-8") or "utf-8"
+    # libyaml's C loader when PyYAML was built with it; same output, much faster.
+    yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-    try:
-        content = raw.decode(encoding)
-    except (UnicodeDecodeError, LookupError):
-        content = raw.decode("utf-8", errors="replace")
+    content = _read_text(path)
 
     # Parse frontmatter
     frontmatter_data = {}
@@ -120,7 +335,7 @@ def _extract_markdown(path: Path) -> list[tuple[int, str]]:
         parts = content.split("---", 2)
         if len(parts) >= 3:
             try:
-                frontmatter_data = yaml.safe_load(parts[1])
+                frontmatter_data = yaml.load(parts[1], Loader=yaml_loader)
                 text = parts[2].strip()
             except Exception as e:
                 logger.warning(f"Failed to parse frontmatter: {e}")
@@ -132,8 +347,9 @@ def _extract_markdown(path: Path) -> list[tuple[int, str]]:
         )
         text = f"{metadata_text}\n\n{text}"
 
-    if text.strip():
-        return [(1, text.strip())]
+    text = text.strip()
+    if text:
+        return [(1, text)]
     return []
 
 
@@ -142,9 +358,8 @@ def _extract_epub(path: Path) -> list[tuple[int, str]]:
     try:
         import ebooklib
         from ebooklib import epub
-        from bs4 import BeautifulSoup
     except ImportError:
-        logger.error("ebooklib not installed. Install with: pip install ebooklib beautifulsoup4")
+        logger.error("ebooklib not installed. Install with: pip install ebooklib")
         return []
 
     try:
@@ -153,56 +368,65 @@ def _extract_epub(path: Path) -> list[tuple[int, str]]:
         logger.error(f"Failed to read EPUB: {e}")
         return []
 
+    contents = [item.get_content() for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
+
+    # Chapters are independent and lxml releases the GIL while parsing, so
+    # threads overlap the parses; map keeps them in book order.
+    workers = min(os.cpu_count() or 1, len(contents))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            texts = list(executor.map(_epub_chapter_text, contents))
+    else:
+        texts = [_epub_chapter_text(content) for content in contents]
+
     chapters = []
     chapter_num = 1
 
-    for item in book.get_items():
-        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            soup = BeautifulSoup(item.get_content(), 'html.parser')
-            text = soup.get_text(separator='\n', strip=True)
-
-            if text.strip():
-                chapters.append((chapter_num, text.strip()))
-                chapter_num += 1
+    for text in texts:
+        if text:
+            chapters.append((chapter_num, text))
+            chapter_num += 1
 
     return chapters
 
 
 def _extract_html(path: Path) -> list[tuple[int, str]]:
     """Extract text from HTML files."""
-    try:
-        from bs4 import BeautifulSoup
-    except ImportError:
-        logger.error("beautifulsoup4 not installed. Install with: pip install beautifulsoup4")
-        return []
+    text = _html_text(_read_text(path))
+    if text:
+        return [(1, text)]
+    return []
 
-    import chardet
 
-    raw = path.read_bytes()
-    detected = chardet.detect(raw)
-    encoding = detected.get("encoding", "utf-8") or "utf-8"
+def _epub_chapter_text(content: bytes) -> str:
+    return _html_text(_decode(content))
 
-    try:
-        html = raw.decode(encoding)
-    except (UnicodeDecodeError, LookupError):
-        html = raw.decode("utf-8", errors="replace")
 
-    soup = BeautifulSoup(html, 'html.parser')
+def _html_text(html: str) -> str:
+    """
+    Text of an HTML document with script and style content dropped: each
+    text node stripped, one per line, blank lines removed.
 
-    # Remove script and style elements
-    for script in soup(["script", "style"]):
-        script.decompose()
+    Parses with lxml's C HTML parser rather than BeautifulSoup's pure-Python
+    html.parser.
+    """
+    import lxml.html
+    from lxml import etree
 
-    # Get text
-    text = soup.get_text(separator='\n', strip=True)
+    try:
+        root = lxml.html.document_fromstring(
+            html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8")
+        )
+    except etree.ParserError:
+        # Nothing but whitespace or comments.
+        return ""
 
-    # Clean up whitespace
-    lines = [line.strip() for line in text.splitlines()]
-    text = '\n'.join(line for line in lines if line)
+    for element in root.iter("script", "style"):
+        # Keep the tail: it's the text following the element.
+        element.clear(keep_tail=True)
 
-    if text.strip():
-        return [(1, text.strip())]
-    return []
+    lines = (line.strip() for piece in root.itertext() for line in piece.splitlines())
+    return "\n".join(line for line in lines if line)
 
 
 def _extract_csv(path: Path) -> list[tuple[int, str]]:
@@ -240,17 +464,103 @@ def _extract_csv(path: Path) -> list[tuple[int, str]]:
 
     text = "\n".join(text_parts)
 
-    if text.strip():
-        return [(1, text.strip())]
+    text = text.strip()
+    if text:
+        return [(1, text)]
     return []
 
 
 def _extract_excel(path: Path) -> list[tuple[int, str]]:
-    """Extract text from Excel files."""
+    """
+    Extract text from .xlsx workbooks.
+
+    Streams each sheet with openpyxl's read-only reader, keeping only the
+    sample rows in memory, instead of loading whole sheets into DataFrames.
+    The summary matches what pandas.read_excel would give: the first row is
+    the header, and trailing blank rows and columns are trimmed.
+    """
     try:
+        import openpyxl
         import pandas as pd
+        from pandas.io.parsers import TextParser
     except ImportError:
-        logger.error("pandas not installed. Install with: pip install pandas openpyxl")
+        logger.error("openpyxl not installed. Install with: pip install pandas openpyxl")
+        return []
+
+    try:
+        workbook = openpyxl.load_workbook(str(path), read_only=True, data_only=True)
+    except Exception as e:
+        logger.error(f"Failed to read Excel: {e}")
+        return []
+
+    try:
+        sheets = []
+        for worksheet in workbook.worksheets:
+            # The stored dimensions can be missing or wrong (and would skip
+            # leading blank rows); read the rows actually present.
+            worksheet.reset_dimensions()
+            rows = worksheet.iter_rows(values_only=True)
+            header = _trim_row(next(rows, ()))
+            width = len(header)
+            sample = []
+            # Data rows through the last non-blank one.
+            row_count = 0
+            for n, row in enumerate(rows, 1):
+                row = _trim_row(row)
+                if row:
+                    row_count = n
+                    width = max(width, len(row))
+                if n <= EXCEL_SAMPLE_ROWS:
+                    sample.append(row)
+
+            # Parse the header and sample the way read_excel parses a whole
+            # sheet: empty cells as "", rows padded to the sheet's width.
+            data = [
+                [_excel_value(value) for value in row] + [""] * (width - len(row))
+                for row in [header, *sample[:row_count]]
+            ]
+            df = TextParser(data, header=0, skip_blank_lines=False).read() if width else pd.DataFrame()
+
+            text_parts = [f"Sheet: {worksheet.title}"]
+            text_parts.append("Columns: " + ", ".join(map(str, df.columns)))
+            text_parts.append(f"Total rows: {row_count}")
+            text_parts.append("\nSample data:")
+            text_parts.append(df.to_string(index=False))
+
+            sheets.append((len(sheets) + 1, "\n".join(text_parts)))
+
+        return sheets
+
+    except Exception as e:
+        logger.error(f"Failed to read Excel: {e}")
+        return []
+    finally:
+        workbook.close()
+
+
+def _trim_row(row: tuple) -> tuple:
+    """Drop a row's trailing empty cells."""
+    end = len(row)
+    while end and row[end - 1] is None:
+        end -= 1
+    return row[:end]
+
+
+def _excel_value(value):
+    """A cell value as read_excel hands it to the parser."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _extract_xls(path: Path) -> list[tuple[int, str]]:
+    """Extract text from legacy .xls workbooks, which openpyxl can't read."""
+    try:
+        import pandas as pd
+    except ImportError:
+        logger.error("pandas not installed. Install with: pip install pandas xlrd")
         return []
 
     try:
@@ -282,23 +592,49 @@ def _extract_source_code(path: Path) -> list[tuple[int, str]]:
 
     Preserves code structure and adds file type metadata.
     """
-    import chardet
-
-    raw = path.read_bytes()
-    detected = chardet.detect(raw)
-    encoding = detected.get("encoding", "utf-8") or "utf-8"
-
-    try:
-        code = raw.decode(encoding)
-    except (UnicodeDecodeError, LookupError):
-        code = raw.decode("utf-8", errors="replace")
+    code = _read_text(path)
 
     # Add metadata
     file_type = path.suffix[1:] if path.suffix else "unknown"
     metadata = f"File type: {file_type}\nFile name: {path.name}\n\n"
 
-    text = metadata + code.strip()
-
-    if text.strip():
-        return [(1, text.strip())]
-    return []
+    # The metadata header means there is always text to return.
+    return [(1, metadata + code.strip())]
+
+
+# File extension -> extractor, built once at import.
+_EXTRACTORS = {
+    ".pdf": _extract_pdf,
+    ".txt": _extract_plain,
+    ".md": _extract_markdown,
+    ".docx": _extract_docx,
+    ".epub": _extract_epub,
+    ".html": _extract_html,
+    ".htm": _extract_html,
+    ".csv": _extract_csv,
+    ".xlsx": _extract_excel,
+    ".xls": _extract_xls,
+    # Source code files
+    ".py": _extract_source_code,
+    ".js": _extract_source_code,
+    ".ts": _extract_source_code,
+    ".tsx": _extract_source_code,
+    ".jsx": _extract_source_code,
+    ".rs": _extract_source_code,
+    ".go": _extract_source_code,
+    ".java": _extract_source_code,
+    ".cpp": _extract_source_code,
+    ".c": _extract_source_code,
+    ".h": _extract_source_code,
+    ".hpp": _extract_source_code,
+    ".rb": _extract_source_code,
+    ".php": _extract_source_code,
+    ".swift": _extract_source_code,
+    ".kt": _extract_source_code,
+    ".sql": _extract_source_code,
+    ".sh": _extract_source_code,
+    ".yaml": _extract_source_code,
+    ".yml": _extract_source_code,
+    ".json": _extract_source_code,
+    ".xml": _extract_source_code,
+}
@@ -26,6 +26,13 @@ export function useWorkspace() {
     loadDocuments();
   }, [loadDocuments]);
 
+  // Uploads are ingested in the background; poll until none are still processing.
+  useEffect(() => {
+    if (!documents.some((d) => d.status === "processing")) return;
+    const timer = setTimeout(loadDocuments, 2000);
+    return () => clearTimeout(timer);
+  }, [documents, loadDocuments]);
+
   const uploadFile = useCallback(
     async (file: File) => {
       if (!activeWorkspace) return;
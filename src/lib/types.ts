@@ -150,7 +150,6 @@ export interface ConversationSearchResult {
   conversation_title: string;
   message_id: string;
   role: string;
-  content: string;
   match_preview: string;
   created_at: string;
 }